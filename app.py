@@ -1,15 +1,36 @@
 from flask import Flask, render_template, request, jsonify, send_file, session, redirect, url_for
 import pandas as pd
+import numpy as np
 import os
 import uuid
 import tempfile
 import shutil
 from datetime import datetime, timedelta
 from openpyxl.styles import Alignment, numbers
-from openpyxl import Workbook
+from openpyxl import Workbook, load_workbook
+from openpyxl.utils.exceptions import InvalidFileException
 from werkzeug.utils import secure_filename
 import threading
 import time
+import json
+import queue
+import sqlite3
+import mmap
+import struct
+import re
+import csv
+import itertools
+import codecs
+import zipfile
+from array import array
+from collections import OrderedDict
+from collections.abc import MutableMapping, Sequence
+from contextlib import contextmanager
+
+try:
+    import redis
+except ImportError:  # Optional: only needed for STATE_BACKEND=redis
+    redis = None
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-change-this-in-production'
@@ -19,20 +40,300 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 UPLOAD_FOLDER = 'uploads'
 OUTPUT_FOLDER = 'output'
 ALLOWED_EXTENSIONS = {'txt'}
+ROLL_LIST_EXTENSIONS = {'txt', 'csv', 'xlsx'}
+
+# Shared state backend so any worker can serve any request: 'sqlite', 'redis' or 'memory'
+STATE_BACKEND = os.environ.get('STATE_BACKEND', 'sqlite').lower()
+STATE_DB = os.environ.get('STATE_DB', os.path.join('state', 'state.db'))
+STATE_REDIS_URL = os.environ.get('STATE_REDIS_URL', 'redis://localhost:6379/0')
+STATE_POOL_SIZE = int(os.environ.get('STATE_POOL_SIZE', 4))
+
+# Merit lists: CBSE best-five aggregate, skipping internally assessed subjects
+# (500 Work Experience, 502 Health & Physical Education, 503 General Studies)
+BEST_OF_SUBJECTS = 5
+INTERNAL_SUBJECT_CODES = {'500', '502', '503'}
+
+# Parsed uploads are persisted next to the raw file; bump PARSER_VERSION whenever
+# parsing output changes so stale files are re-parsed instead of reused
+PARSER_VERSION = 4
+PARSED_CACHE_SUFFIX = '.cbsecol'
+PARSED_CACHE_MAGIC = b'CBSECOL\x00'
+PARSED_CACHE_FORMAT = 1
+
+# Result analysis: CBSE grade bands (older E1/E2 gazettes are folded into E)
+GRADE_BANDS = ['A1', 'A2', 'B1', 'B2', 'C1', 'C2', 'D1', 'D2', 'E']
+FAIL_GRADE_BAND = 'E'
+# School code kept on each candidate row but never exported as a column
+SCHOOL_FIELD = 'School'
+# Whitespace that str.split()/strip() honour but bytes methods do not, as UTF-8 sequences
+UNICODE_SPACE_BYTES = rb'[\x1c-\x1f]|\xc2[\x85\xa0]|\xe1\x9a\x80|\xe2\x80[\x80-\x8a\xa8\xa9\xaf]|\xe2\x81\x9f|\xe3\x80\x80'
+ASCII_SPACE_TABLE = bytes.maketrans(b'\x1c\x1d\x1e\x1f', b'    ')
+UNICODE_SPACE_TABLE = {cp: ' ' for cp in range(0x3001) if chr(cp).isspace()}
+SPACE = rb'(?:\s|' + UNICODE_SPACE_BYTES + rb')*'
+SCHOOL_HEADER_PATTERN = re.compile(
+    SPACE + rb'SCHOOL' + SPACE + rb'(?:CODE|NO\.?)?' + SPACE + rb':?' + SPACE + rb'-?' + SPACE
+    + rb'(\d{5})\b' + SPACE + rb'(.*)', re.IGNORECASE
+)
+# Cheap zero-copy test that a line may start with a roll number
+CANDIDATE_PREFIX_PATTERN = re.compile(SPACE + rb'\d')
+RESULT_TOKENS = {b'PASS', b'COMP', b'UFM', b'ABST', b'REPEAT'}
 
 # Create necessary directories
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 os.makedirs('static', exist_ok=True)  # For logo and static assets
 
-# Store processing history and file cache in memory
-processing_history = {}
-file_cache = {}
+
+# Pluggable state stores shared across gunicorn workers
+class MemoryStateStore:
+    """Process-local store, only suitable for a single worker"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, namespace, key):
+        with self._lock:
+            value = self._data.get(namespace, {}).get(key)
+        return None if value is None else json.loads(value)
+
+    def set(self, namespace, key, value):
+        with self._lock:
+            self._data.setdefault(namespace, {})[key] = json.dumps(value)
+
+    def delete(self, namespace, key):
+        with self._lock:
+            return self._data.get(namespace, {}).pop(key, None) is not None
+
+    def items(self, namespace):
+        with self._lock:
+            items = list(self._data.get(namespace, {}).items())
+        return [(key, json.loads(value)) for key, value in items]
+
+    def recent(self, namespace, count):
+        with self._lock:
+            items = list(self._data.get(namespace, {}).items())[-count:]
+        return [(key, json.loads(value)) for key, value in items]
+
+    def clear(self, namespace):
+        with self._lock:
+            self._data.pop(namespace, None)
+
+
+class SQLiteStateStore:
+    """SQLite (WAL mode) store with a small pool of reusable connections"""
+
+    def __init__(self, path, pool_size=4):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.pool_size = pool_size
+        self._lock = threading.Lock()
+        self._reset_pool()
+        with self._connection() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS kv ('
+                'namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, '
+                'PRIMARY KEY (namespace, key))'
+            )
+
+    def _reset_pool(self):
+        # Connections must not cross a fork, so each worker process builds its own pool
+        self._pid = os.getpid()
+        self._pool = queue.LifoQueue()
+        self._created = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset_pool()
+            pool = self._pool
+            try:
+                conn = pool.get_nowait()
+            except queue.Empty:
+                conn = None
+                if self._created < self.pool_size:
+                    conn = self._connect()
+                    self._created += 1
+        if conn is None:
+            conn = pool.get()
+        try:
+            yield conn
+        finally:
+            pool.put(conn)
+
+    def get(self, namespace, key):
+        with self._connection() as conn:
+            row = conn.execute(
+                'SELECT value FROM kv WHERE namespace = ? AND key = ?', (namespace, key)
+            ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def set(self, namespace, key, value):
+        with self._connection() as conn:
+            conn.execute(
+                'INSERT INTO kv (namespace, key, value) VALUES (?, ?, ?) '
+                'ON CONFLICT(namespace, key) DO UPDATE SET value = excluded.value',
+                (namespace, key, json.dumps(value))
+            )
+
+    def delete(self, namespace, key):
+        with self._connection() as conn:
+            cursor = conn.execute('DELETE FROM kv WHERE namespace = ? AND key = ?', (namespace, key))
+        return cursor.rowcount > 0
+
+    def items(self, namespace):
+        with self._connection() as conn:
+            rows = conn.execute(
+                'SELECT key, value FROM kv WHERE namespace = ? ORDER BY rowid', (namespace,)
+            ).fetchall()
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def recent(self, namespace, count):
+        with self._connection() as conn:
+            rows = conn.execute(
+                'SELECT key, value FROM kv WHERE namespace = ? ORDER BY rowid DESC LIMIT ?',
+                (namespace, count)
+            ).fetchall()
+        return [(key, json.loads(value)) for key, value in reversed(rows)]
+
+    def clear(self, namespace):
+        with self._connection() as conn:
+            conn.execute('DELETE FROM kv WHERE namespace = ?', (namespace,))
+
+
+class RedisStateStore:
+    """Store for any Redis-protocol server, using a shared connection pool"""
+
+    def __init__(self, url, pool_size=4):
+        if redis is None:
+            raise RuntimeError('STATE_BACKEND=redis requires the redis package')
+        pool = redis.ConnectionPool.from_url(url, max_connections=pool_size)
+        self._client = redis.Redis(connection_pool=pool)
+
+    def get(self, namespace, key):
+        value = self._client.hget(f"cbse:{namespace}", key)
+        return None if value is None else json.loads(value)
+
+    def set(self, namespace, key, value):
+        pipe = self._client.pipeline()
+        pipe.hset(f"cbse:{namespace}", key, json.dumps(value))
+        pipe.zadd(f"cbse:{namespace}:order", {key: time.time()}, nx=True)
+        pipe.execute()
+
+    def delete(self, namespace, key):
+        pipe = self._client.pipeline()
+        pipe.hdel(f"cbse:{namespace}", key)
+        pipe.zrem(f"cbse:{namespace}:order", key)
+        return pipe.execute()[0] > 0
+
+    def items(self, namespace):
+        return self._load(namespace, self._client.zrange(f"cbse:{namespace}:order", 0, -1))
+
+    def recent(self, namespace, count):
+        keys = self._client.zrevrange(f"cbse:{namespace}:order", 0, count - 1)
+        return self._load(namespace, list(reversed(keys)))
+
+    def _load(self, namespace, keys):
+        if not keys:
+            return []
+        values = self._client.hmget(f"cbse:{namespace}", keys)
+        return [
+            (key.decode('utf-8'), json.loads(value))
+            for key, value in zip(keys, values) if value is not None
+        ]
+
+    def clear(self, namespace):
+        self._client.delete(f"cbse:{namespace}", f"cbse:{namespace}:order")
+
+
+class StateNamespace(MutableMapping):
+    """Dict-like view over one namespace of the shared state store"""
+
+    def __init__(self, store, namespace):
+        self.store = store
+        self.namespace = namespace
+
+    def __getitem__(self, key):
+        value = self.store.get(self.namespace, key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.store.set(self.namespace, key, value)
+
+    def __delitem__(self, key):
+        if not self.store.delete(self.namespace, key):
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return self.store.get(self.namespace, key) is not None
+
+    def __iter__(self):
+        return iter([key for key, _ in self.store.items(self.namespace)])
+
+    def __len__(self):
+        return len(self.store.items(self.namespace))
+
+    def items(self):
+        return self.store.items(self.namespace)
+
+    def recent(self, count):
+        """Last count entries, oldest first, without loading the whole namespace"""
+        return self.store.recent(self.namespace, count)
+
+    def clear(self):
+        self.store.clear(self.namespace)
+
+
+def create_state_store(backend=STATE_BACKEND):
+    if backend == 'sqlite':
+        return SQLiteStateStore(STATE_DB, STATE_POOL_SIZE)
+    if backend == 'redis':
+        return RedisStateStore(STATE_REDIS_URL, STATE_POOL_SIZE)
+    if backend == 'memory':
+        return MemoryStateStore()
+    raise ValueError(f"Unknown STATE_BACKEND: {backend}")
+
+
+# Job history and upload metadata are shared; parsed data stays cached per process
+state_store = create_state_store()
+processing_history = StateNamespace(state_store, 'history')
+upload_registry = StateNamespace(state_store, 'uploads')
+# cache key -> (source file, parsed data); least recently used parses are dropped
+file_cache = OrderedDict()
+file_cache_lock = threading.Lock()
+FILE_CACHE_SIZE = int(os.environ.get('FILE_CACHE_SIZE', 8))
 
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def allowed_roll_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ROLL_LIST_EXTENSIONS
+
+def get_session_upload():
+    """Shared registry entry for this session's upload, or None"""
+    upload_id = session.get('upload_id')
+    return upload_registry.get(upload_id) if upload_id else None
+
+def parse_upload(upload_info):
+    """Cached parse of a registered upload, via its persisted-parse pointer"""
+    return parse_and_cache_file(upload_info['filepath'], upload_info['parsed_cache'])
+
+def request_flag(data, name):
+    """Boolean option from a JSON body or a multipart form field"""
+    return str(data.get(name, '')).lower() in ('1', 'true', 'on', 'yes')
+
 def cleanup_old_files():
     """Clean up files older than 1 hour"""
     while True:
@@ -45,6 +346,15 @@ def cleanup_old_files():
                         file_time = datetime.fromtimestamp(os.path.getctime(file_path))
                         if current_time - file_time > timedelta(hours=1):
                             os.remove(file_path)
+            
+            # Drop shared state entries whose files are gone
+            for upload_id, info in upload_registry.items():
+                if not os.path.exists(info['filepath']):
+                    upload_registry.pop(upload_id, None)
+            for process_id, info in processing_history.items():
+                if not os.path.exists(info['output_file']):
+                    processing_history.pop(process_id, None)
+            prune_file_cache()
             time.sleep(3600)
         except Exception as e:
             print(f"Cleanup error: {e}")
@@ -53,18 +363,32 @@ def cleanup_old_files():
 cleanup_thread = threading.Thread(target=cleanup_old_files, daemon=True)
 cleanup_thread.start()
 
-def parse_candidate_line(line):
+# Record parsers work on raw bytes; the gazette is fixed-width ASCII apart from names
+def normalise_spaces(data):
+    """Turn every character str.split() treats as whitespace into an ASCII space.
+
+    Afterwards bytes split/strip give exactly what the text parser's str methods
+    gave, e.g. an NBSP inside a name separates its words again.
+    """
+    if data.isascii():
+        return data.translate(ASCII_SPACE_TABLE)
+    return data.decode('utf-8', 'replace').translate(UNICODE_SPACE_TABLE).encode('utf-8')
+
+def parse_candidate_record(line):
     roll_no = line[:8].strip()
     remaining = line[8:].lstrip()
     if not remaining:
-        return roll_no, '', '', [], '', ''
+        return roll_no, b'', b'', [], b'', b''
     
-    gender = remaining[0]
-    remaining = remaining[1:].lstrip()
+    # Gender is one character, which is a single byte unless the field holds something odd
+    gender = remaining[:1]
+    if gender[0] >= 0x80:
+        gender = remaining.decode('utf-8', 'replace')[:1].encode('utf-8')
+    remaining = remaining[len(gender):].lstrip()
     parts = remaining.split()
     name_parts = []
     subjects = []
-    result = ''
+    result = b''
     comp_sub = []
     found_subject = False
     
@@ -77,97 +401,172 @@ def parse_candidate_line(line):
         elif not found_subject:
             name_parts.append(token)
         else:
-            if token == 'ESSENTIAL' and i + 1 < len(parts) and parts[i+1] == 'REPEAT':
-                result = 'ESSENTIAL REPEAT'
+            if token == b'ESSENTIAL' and i + 1 < len(parts) and parts[i+1] == b'REPEAT':
+                result = b'ESSENTIAL REPEAT'
                 i += 1
                 comp_sub = parts[i+1:]
                 break
-            elif token in ['PASS', 'COMP', 'UFM', 'ABST', 'REPEAT']:
+            elif token in RESULT_TOKENS:
                 result = token
                 comp_sub = parts[i+1:]
                 break
         i += 1
     
-    name = ' '.join(name_parts)
-    return roll_no, gender, name, subjects, result, ' '.join(comp_sub)
+    return roll_no, gender, b' '.join(name_parts), subjects, result, b' '.join(comp_sub)
 
-def parse_marks_line(line):
+def parse_marks_record(line):
     tokens = line.split()
     marks_and_grades = []
     
     i = 0
     while i < len(tokens):
-        if tokens[i].replace('-', '').isdigit() or tokens[i] == '':
+        if tokens[i].replace(b'-', b'').isdigit():
+            mark = tokens[i].lstrip(b'0') or b'0'
             if i + 1 < len(tokens):
-                mark = tokens[i].lstrip('0') or '0'
                 marks_and_grades.append((mark, tokens[i+1]))
                 i += 2
             else:
-                mark = tokens[i].lstrip('0') or '0'
-                marks_and_grades.append((mark, ''))
+                marks_and_grades.append((mark, b''))
                 i += 1
         else:
             i += 1
     
     return marks_and_grades
 
+def iter_gazette_lines(mm):
+    """Yield (start, end) offsets of each line in the mapped file, without copying"""
+    size = len(mm)
+    pos = 0
+    while pos < size:
+        end = mm.find(b'\n', pos)
+        if end == -1:
+            end = size
+        yield pos, end
+        pos = end + 1
+
+def file_cache_key(input_file):
+    return f"{input_file}_{os.path.getmtime(input_file)}"
+
+
+def prune_file_cache():
+    """Drop cached parses whose source file is gone or has changed.
+
+    Uploads deleted through another worker are noticed here. Dropping the entry
+    releases a mapped .cbsecol (and its descriptor) once no request still uses it.
+    """
+    with file_cache_lock:
+        for cache_key, (input_file, _) in list(file_cache.items()):
+            try:
+                current = file_cache_key(input_file)
+            except OSError:
+                current = None
+            if current != cache_key:
+                del file_cache[cache_key]
+
+
+def evict_file_cache(cache_key):
+    with file_cache_lock:
+        file_cache.pop(cache_key, None)
+
+
 # Enhanced function to parse and cache data
-def parse_and_cache_file(input_file):
+def parse_and_cache_file(input_file, cache_path=None):
     """Parse file and cache the structured data for faster filtering"""
-    cache_key = f"{input_file}_{os.path.getmtime(input_file)}"
+    cache_key = file_cache_key(input_file)
     
-    if cache_key in file_cache:
-        return file_cache[cache_key]
+    with file_cache_lock:
+        if cache_key in file_cache:
+            file_cache.move_to_end(cache_key)
+            return file_cache[cache_key][1]
     
-    with open(input_file, 'r', encoding='utf-8') as f:
-        lines = [line.rstrip('\n').rstrip('\r') for line in f.readlines()]
+    # Reuse the persisted parse when it matches this file and parser version
+    cache_path = cache_path or parsed_cache_path(input_file)
+    cached_data = load_parsed_cache(input_file, cache_path)
+    if cached_data is None:
+        cached_data = parse_gazette(input_file)
+        try:
+            write_parsed_cache(input_file, cache_path, cached_data)
+        except OSError as e:
+            print(f"Could not persist parsed cache for {input_file}: {e}")
     
-    all_subjects = set()
-    candidates = []
+    # Each new entry is a chance to forget parses of deleted uploads, then bound the size
+    prune_file_cache()
+    with file_cache_lock:
+        file_cache[cache_key] = (input_file, cached_data)
+        while len(file_cache) > FILE_CACHE_SIZE:
+            file_cache.popitem(last=False)
+    return cached_data
+
+
+def parse_gazette(input_file):
+    """Parse the raw gazette into candidate rows, columns and subject codes.
+
+    The file is memory-mapped and scanned as bytes: only candidate and marks
+    lines are sliced out, and only names are decoded as UTF-8. Repeated short
+    tokens (subject codes, grades, results) are decoded once and reused.
+    """
+    tokens = {}
+    subject_keys = {}
     
-    # First pass: collect all subjects
-    i = 0
-    while i < len(lines):
-        line = lines[i].strip()
-        if line and line[:8].strip().isdigit():
-            _, _, _, subjects, _, _ = parse_candidate_line(line)
-            all_subjects.update(subjects)
-        i += 1
+    def text(value):
+        decoded = tokens.get(value)
+        if decoded is None:
+            decoded = tokens[value] = value.decode('utf-8', 'replace')
+        return decoded
     
-    subject_codes = sorted(all_subjects)
+    candidates = []
+    schools = {}
+    school_code = ''
     
-    # Second pass: parse all candidates
-    i = 0
-    while i < len(lines):
-        line = lines[i].strip()
-        if line and line[:8].strip().isdigit():
-            roll_no, gender, name, subjects, result, comp_sub = parse_candidate_line(line)
-            
-            i += 1
-            marks_line = lines[i].strip() if i < len(lines) else ''
-            marks_and_grades = parse_marks_line(marks_line)
-            
-            candidate_data = {
-                'Roll No': roll_no,
-                'Gender': gender,
-                'Name': name
-            }
-            
-            for code in subject_codes:
-                candidate_data[f"{code}_Marks"] = ''
-                candidate_data[f"{code}_Grade"] = ''
-            
-            if result not in ['UFM', 'ABST']:
-                for subj, (mark, grade) in zip(subjects, marks_and_grades):
-                    if subj in subject_codes:
-                        candidate_data[f"{subj}_Marks"] = int(mark) if mark.isdigit() else mark
-                        candidate_data[f"{subj}_Grade"] = grade
-            
-            candidate_data['Result'] = result
-            candidate_data['Comp Sub'] = comp_sub
-            candidates.append(candidate_data)
-        
-        i += 1
+    with open(input_file, 'rb') as f:
+        # mmap cannot map an empty file; an empty gazette simply has no candidates
+        if os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                line_offsets = iter_gazette_lines(mm)
+                for start, end in line_offsets:
+                    school_match = SCHOOL_HEADER_PATTERN.match(mm, start, end)
+                    if school_match:
+                        school_code = school_match.group(1).decode('ascii')
+                        schools[school_code] = school_match.group(2).decode('utf-8', 'replace').strip()
+                        continue
+                    if not CANDIDATE_PREFIX_PATTERN.match(mm, start, end):
+                        continue
+                    
+                    line = normalise_spaces(mm[start:end]).strip()
+                    if not line[:8].strip().isdigit():
+                        continue
+                    
+                    roll_no, gender, name, subjects, result, comp_sub = parse_candidate_record(line)
+                    
+                    marks_offsets = next(line_offsets, None)
+                    marks_line = normalise_spaces(mm[marks_offsets[0]:marks_offsets[1]]) if marks_offsets else b''
+                    marks_and_grades = parse_marks_record(marks_line)
+                    
+                    # Only the subjects this candidate took; the rest are filled in below
+                    candidate_data = {
+                        'Roll No': roll_no.decode('ascii', 'replace'),
+                        'Gender': text(gender),
+                        'Name': name.decode('utf-8', 'replace')
+                    }
+                    
+                    for subj in subjects:
+                        if subj not in subject_keys:
+                            code = text(subj)
+                            subject_keys[subj] = (f"{code}_Marks", f"{code}_Grade")
+                    
+                    result = text(result)
+                    if result not in ['UFM', 'ABST']:
+                        for subj, (mark, grade) in zip(subjects, marks_and_grades):
+                            marks_key, grade_key = subject_keys[subj]
+                            candidate_data[marks_key] = int(mark) if mark.isdigit() else text(mark)
+                            candidate_data[grade_key] = text(grade)
+                    
+                    candidate_data['Result'] = result
+                    candidate_data['Comp Sub'] = text(comp_sub)
+                    candidate_data[SCHOOL_FIELD] = school_code
+                    candidates.append(candidate_data)
+    
+    subject_codes = sorted(text(subj) for subj in subject_keys)
     
     columns = ['Roll No', 'Gender', 'Name']
     for code in subject_codes:
@@ -175,16 +574,498 @@ def parse_and_cache_file(input_file):
         columns.append(f"{code}_Grade")
     columns.extend(['Result', 'Comp Sub'])
     
+    # Expand each row to the full column set, in column order
+    template = dict.fromkeys(columns, '')
+    for i, candidate_data in enumerate(candidates):
+        row = template.copy()
+        row.update(candidate_data)
+        candidates[i] = row
+    
     cached_data = {
         'candidates': candidates,
         'columns': columns,
-        'subject_codes': subject_codes
+        'subject_codes': subject_codes,
+        'schools': schools
     }
     
-    file_cache[cache_key] = cached_data
     return cached_data
 
 
+# Columnar binary persistence of parsed uploads
+#
+# Layout: magic, uint32 format version, uint32 header length, JSON header,
+# then one 8-byte aligned segment per column array. The header carries the
+# parser version, source size/mtime, subject codes and the column schema.
+def parsed_cache_path(input_file):
+    return input_file + PARSED_CACHE_SUFFIX
+
+
+def _encode_column(name, values):
+    """Pick the most compact encoding for one column; returns (spec, arrays)"""
+    if name.endswith('_Marks') and all(v == '' or isinstance(v, int) for v in values):
+        marks = np.array([-1 if v == '' else v for v in values], dtype=np.int32)
+        return {'name': name, 'type': 'int32'}, [marks]
+    
+    values = [str(v) for v in values]
+    distinct = sorted(set(values))
+    if len(distinct) <= 256:
+        lookup = {value: code for code, value in enumerate(distinct)}
+        codes = np.array([lookup[v] for v in values], dtype=np.uint8)
+        return {'name': name, 'type': 'dict', 'values': distinct}, [codes]
+    
+    encoded = [v.encode('utf-8') for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint32)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    blob = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    return {'name': name, 'type': 'str'}, [offsets, blob]
+
+
+def write_parsed_cache(input_file, cache_path, cached_data):
+    """Persist parsed data in the columnar format (atomic replace)"""
+    candidates = cached_data['candidates']
+    columns = cached_data['columns']
+    source = os.stat(input_file)
+    
+    specs = []
+    arrays = []
+    for name in columns + [SCHOOL_FIELD]:
+        spec, column_arrays = _encode_column(name, candidate_column(candidates, name))
+        spec['segments'] = []
+        for array in column_arrays:
+            spec['segments'].append({'dtype': array.dtype.str, 'count': len(array), 'offset': 0})
+            arrays.append(array)
+        specs.append(spec)
+    
+    header = {
+        'parser_version': PARSER_VERSION,
+        'source_size': source.st_size,
+        'source_mtime': source.st_mtime,
+        'rows': len(candidates),
+        'subject_codes': cached_data['subject_codes'],
+        'schools': cached_data['schools'],
+        'hidden_columns': [SCHOOL_FIELD],
+        'columns': specs
+    }
+    
+    # Segment offsets depend on the header length, so lay out until it is stable
+    segments = [segment for spec in specs for segment in spec['segments']]
+    header_bytes = b''
+    while True:
+        position = len(PARSED_CACHE_MAGIC) + 8 + len(header_bytes)
+        for segment, array in zip(segments, arrays):
+            position += -position % 8
+            segment['offset'] = position
+            position += array.nbytes
+        new_header_bytes = json.dumps(header).encode('utf-8')
+        stable = len(new_header_bytes) == len(header_bytes)
+        header_bytes = new_header_bytes
+        if stable:
+            break
+    
+    tmp_path = f"{cache_path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(PARSED_CACHE_MAGIC)
+        f.write(struct.pack('<II', PARSED_CACHE_FORMAT, len(header_bytes)))
+        f.write(header_bytes)
+        for segment, array in zip(segments, arrays):
+            f.write(b'\x00' * (segment['offset'] - f.tell()))
+            f.write(array.tobytes())
+    os.replace(tmp_path, cache_path)
+
+
+def _decode_column(mm, spec, rows):
+    arrays = [
+        np.frombuffer(mm, dtype=np.dtype(seg['dtype']), count=seg['count'], offset=seg['offset'])
+        for seg in spec['segments']
+    ]
+    if spec['type'] == 'int32':
+        return ['' if v < 0 else v for v in arrays[0].tolist()]
+    if spec['type'] == 'dict':
+        values = spec['values']
+        if spec['name'].endswith('_Marks'):
+            values = [int(v) if v.isdigit() else v for v in values]
+        return [values[code] for code in arrays[0].tolist()]
+    
+    offsets = arrays[0].tolist()
+    data = memoryview(mm)[spec['segments'][1]['offset']:]
+    try:
+        values = [str(data[offsets[i]:offsets[i + 1]], 'utf-8') for i in range(rows)]
+    finally:
+        data.release()
+    if spec['name'].endswith('_Marks'):
+        values = [int(v) if v.isdigit() else v for v in values]
+    return values
+
+
+class ColumnarCandidates(Sequence):
+    """Candidate rows backed by a mapped .cbsecol file.
+
+    The mapping stays open for as long as the parse is cached. Columns are
+    decoded on first use and kept; int32 marks columns are also available as
+    numpy views straight over the map, so ranking and analysis never build rows.
+    """
+
+    def __init__(self, mm, specs, rows):
+        self._mm = mm
+        self._specs = {spec['name']: spec for spec in specs}
+        self._names = [spec['name'] for spec in specs]
+        self._rows = rows
+        self._columns = {}
+
+    def __len__(self):
+        return self._rows
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._rows))]
+        return {name: self.column(name)[index] for name in self._names}
+
+    def column(self, name):
+        values = self._columns.get(name)
+        if values is None:
+            values = self._columns[name] = _decode_column(self._mm, self._specs[name], self._rows)
+        return values
+
+    def array(self, name):
+        """Raw int32 view of a marks column (-1 = blank), or None for other encodings"""
+        spec = self._specs[name]
+        if spec['type'] != 'int32':
+            return None
+        segment = spec['segments'][0]
+        return np.frombuffer(self._mm, dtype=np.dtype(segment['dtype']),
+                             count=segment['count'], offset=segment['offset'])
+
+
+def _check_segments(mm, specs, rows):
+    """Raise ValueError unless every column segment lies inside the mapped file"""
+    for spec in specs:
+        expected = [rows + 1, None] if spec['type'] == 'str' else [rows]
+        if len(spec['segments']) != len(expected):
+            raise ValueError(f"column {spec['name']} has {len(spec['segments'])} segments")
+        for segment, count in zip(spec['segments'], expected):
+            end = segment['offset'] + segment['count'] * np.dtype(segment['dtype']).itemsize
+            if (count is not None and segment['count'] != count) or end > len(mm):
+                raise ValueError(f"column {spec['name']} is truncated")
+        if spec['type'] == 'str' and rows:
+            # String data must cover the last offset (read from a copy so no view is left on the map)
+            offsets, blob = spec['segments']
+            itemsize = np.dtype(offsets['dtype']).itemsize
+            last = offsets['offset'] + rows * itemsize
+            if np.frombuffer(mm[last:last + itemsize], dtype=np.dtype(offsets['dtype']))[0] > blob['count']:
+                raise ValueError(f"column {spec['name']} is truncated")
+
+
+def load_parsed_cache(input_file, cache_path):
+    """Map a persisted parse for lazy column access; None if missing, stale or from another parser version"""
+    if not os.path.exists(cache_path) or os.path.getsize(cache_path) < len(PARSED_CACHE_MAGIC) + 8:
+        return None
+    
+    source = os.stat(input_file)
+    with open(cache_path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        prefix = len(PARSED_CACHE_MAGIC)
+        format_version, header_length = struct.unpack_from('<II', mm, prefix)
+        if mm[:prefix] == PARSED_CACHE_MAGIC and format_version == PARSED_CACHE_FORMAT:
+            header = json.loads(mm[prefix + 8:prefix + 8 + header_length])
+            if (header['parser_version'] == PARSER_VERSION
+                    and header['source_size'] == source.st_size
+                    and header['source_mtime'] == source.st_mtime):
+                _check_segments(mm, header['columns'], header['rows'])
+                all_columns = [spec['name'] for spec in header['columns']]
+                return {
+                    'candidates': ColumnarCandidates(mm, header['columns'], header['rows']),
+                    'columns': [name for name in all_columns if name not in header['hidden_columns']],
+                    'subject_codes': header['subject_codes'],
+                    'schools': header['schools']
+                }
+    except (ValueError, KeyError, IndexError, struct.error) as e:
+        print(f"Ignoring unreadable parsed cache {cache_path}: {e}")
+    
+    # No views were handed out, so the mapping can be released right away
+    mm.close()
+    return None
+
+
+# Column access shared by fresh parses (lists of row dicts) and mapped parses
+def candidate_column(candidates, name):
+    if isinstance(candidates, ColumnarCandidates):
+        return candidates.column(name)
+    return [candidate[name] for candidate in candidates]
+
+
+def marks_matrix(candidates, subject_codes):
+    """Float matrix of numeric marks per candidate and subject, NaN where blank or non-numeric"""
+    marks = np.full((len(candidates), len(subject_codes)), np.nan)
+    for j, code in enumerate(subject_codes):
+        name = f"{code}_Marks"
+        view = candidates.array(name) if isinstance(candidates, ColumnarCandidates) else None
+        if view is not None:
+            marks[view >= 0, j] = view[view >= 0]
+        else:
+            for i, mark in enumerate(candidate_column(candidates, name)):
+                if isinstance(mark, int):
+                    marks[i, j] = mark
+    return marks
+
+
+def candidates_frame(cached_data, positions=None):
+    """DataFrame of all candidates, or of the given row positions, built column by column"""
+    candidates = cached_data['candidates']
+    if len(candidates if positions is None else positions) == 0:
+        return pd.DataFrame(columns=cached_data['columns'])
+    data = {}
+    for name in cached_data['columns']:
+        values = candidate_column(candidates, name)
+        data[name] = values if positions is None else [values[i] for i in positions]
+    return pd.DataFrame(data, columns=cached_data['columns'])
+
+
+class Ranking:
+    """Precomputed order, competition ranks and percentiles for one score column"""
+
+    def __init__(self, scores):
+        self.scores = scores
+        ranked = np.flatnonzero(~np.isnan(scores))
+        # Best score first; ties keep file order
+        self.order = ranked[np.argsort(-scores[ranked], kind='stable')]
+        ascending = np.sort(scores[ranked])
+        self.count = len(ranked)
+        
+        at_or_below = np.searchsorted(ascending, scores[self.order], side='right')
+        self.ranks = np.zeros(len(scores), dtype=np.int64)
+        self.ranks[self.order] = self.count - at_or_below + 1
+        self.percentiles = np.full(len(scores), np.nan)
+        if self.count:
+            self.percentiles[self.order] = np.round(100.0 * at_or_below / self.count, 2)
+
+    def top(self, n):
+        return self.order[:n]
+
+    def rank_of(self, index):
+        return int(self.ranks[index]) or None
+
+    def percentile_of(self, index):
+        value = self.percentiles[index]
+        return None if np.isnan(value) else float(value)
+
+
+class MeritIndex:
+    """Best-five aggregate and per-subject rankings for one parsed upload, overall and per school"""
+
+    def __init__(self, cached_data):
+        candidates = cached_data['candidates']
+        self.subject_codes = [
+            code for code in cached_data['subject_codes'] if code not in INTERNAL_SUBJECT_CODES
+        ]
+        self.roll_numbers = candidate_column(candidates, 'Roll No')
+        self.names = candidate_column(candidates, 'Name')
+        self.roll_index = {roll_no: i for i, roll_no in enumerate(self.roll_numbers)}
+        
+        marks = marks_matrix(candidates, self.subject_codes)
+        
+        # Best five per row: sort descending with missing marks last
+        best = -np.sort(np.where(np.isnan(marks), 1, -marks), axis=1)[:, :BEST_OF_SUBJECTS]
+        counted = best >= 0
+        total = np.where(counted, best, 0).sum(axis=1)
+        # Only candidates with a full best-five set are placed on the aggregate list
+        self.aggregate = np.where(counted.sum(axis=1) == BEST_OF_SUBJECTS, total, np.nan)
+        
+        self.rankings = {'aggregate': Ranking(self.aggregate)}
+        for j, code in enumerate(self.subject_codes):
+            self.rankings[code] = Ranking(marks[:, j])
+        
+        # Same rankings within each school: group rows by school once, rank each group's slice
+        school_codes, self.school_of = np.unique(
+            np.array(candidate_column(candidates, SCHOOL_FIELD), dtype=str), return_inverse=True
+        )
+        self.school_codes = [str(code) for code in school_codes]
+        by_school = np.argsort(self.school_of, kind='stable')
+        bounds = np.cumsum(np.bincount(self.school_of, minlength=len(self.school_codes)))[:-1]
+        self.school_position = np.zeros(len(candidates), dtype=np.int64)
+        self.school_members = {}
+        self.school_rankings = {}
+        for school, members in zip(self.school_codes, np.split(by_school, bounds)):
+            self.school_position[members] = np.arange(len(members))
+            self.school_members[school] = members
+            self.school_rankings[school] = {
+                key: Ranking(ranking.scores[members]) for key, ranking in self.rankings.items()
+            }
+
+    def entry(self, key, index):
+        ranking = self.rankings[key]
+        score = ranking.scores[index]
+        school = self.school_codes[self.school_of[index]]
+        school_ranking = self.school_rankings[school][key]
+        position = self.school_position[index]
+        entry = {
+            'rank': ranking.rank_of(index),
+            'roll_no': self.roll_numbers[index],
+            'name': self.names[index],
+            'score': None if np.isnan(score) else int(score),
+            'percentile': ranking.percentile_of(index),
+            'school': school,
+            'school_rank': school_ranking.rank_of(position),
+            'school_percentile': school_ranking.percentile_of(position)
+        }
+        if key == 'aggregate' and entry['score'] is not None:
+            entry['percentage'] = round(entry['score'] / BEST_OF_SUBJECTS, 2)
+        return entry
+
+    def ranking_for(self, key='aggregate', school=None):
+        return self.rankings[key] if school is None else self.school_rankings[school][key]
+
+    def top(self, key='aggregate', n=10, school=None):
+        indices = self.ranking_for(key, school).top(n)
+        if school is not None:
+            indices = self.school_members[school][indices]
+        return [self.entry(key, index) for index in indices]
+
+    def lookup(self, roll_no):
+        index = self.roll_index.get(roll_no)
+        if index is None:
+            return None
+        result = {'aggregate': self.entry('aggregate', index), 'subjects': {}}
+        for code in self.subject_codes:
+            if self.rankings[code].rank_of(index):
+                result['subjects'][code] = self.entry(code, index)
+        return result
+
+
+def get_merit_index(cached_data):
+    """Build the merit index on first use and keep it with the cached parse"""
+    if 'merit' not in cached_data:
+        cached_data['merit'] = MeritIndex(cached_data)
+    return cached_data['merit']
+
+
+def write_merit_sheet(writer, merit, sheet_name='Merit List'):
+    """Write the best-five aggregate merit list as its own sheet"""
+    rows = []
+    for entry in merit.top('aggregate', merit.rankings['aggregate'].count):
+        rows.append({
+            'Rank': entry['rank'],
+            'Roll No': entry['roll_no'],
+            'Name': entry['name'],
+            'Best Five Total': entry['score'],
+            'Percentage': entry['percentage'],
+            'Percentile': entry['percentile'],
+            'School': entry['school'],
+            'School Rank': entry['school_rank']
+        })
+    df_merit = pd.DataFrame(
+        rows, columns=['Rank', 'Roll No', 'Name', 'Best Five Total', 'Percentage', 'Percentile',
+                       'School', 'School Rank']
+    )
+    df_merit.to_excel(writer, sheet_name=sheet_name, index=False)
+
+
+# Subject-wise and school-wise result analysis
+def _summary_row(appeared, passed, mark_sum, mark_count, band_counts):
+    row = {
+        'Appeared': int(appeared),
+        'Passed': int(passed),
+        'Pass %': round(100.0 * passed / appeared, 2) if appeared else 0.0,
+        'Mean': round(float(mark_sum) / mark_count, 2) if mark_count else None
+    }
+    for band, count in zip(GRADE_BANDS, band_counts):
+        row[band] = int(count)
+    return row
+
+
+def build_result_summary(cached_data):
+    """Appeared, passed, mean and grade-band counts per subject and per school.
+
+    Every statistic comes from one bincount over (school, subject[, band]) cells,
+    so the cost stays linear in candidates x subjects however many schools there are.
+    """
+    candidates = cached_data['candidates']
+    subject_codes = cached_data['subject_codes']
+    schools = cached_data.get('schools', {})
+    n, s_count, b_count = len(candidates), len(subject_codes), len(GRADE_BANDS)
+    
+    band_lookup = {band: idx for idx, band in enumerate(GRADE_BANDS)}
+    fail_band = band_lookup[FAIL_GRADE_BAND]
+    band_lookup.update({'E1': fail_band, 'E2': fail_band})
+    
+    marks = marks_matrix(candidates, subject_codes)
+    bands = np.full((n, s_count), -1, dtype=np.int64)
+    graded = np.zeros((n, s_count), dtype=bool)
+    for j, code in enumerate(subject_codes):
+        for i, grade in enumerate(candidate_column(candidates, f"{code}_Grade")):
+            if grade:
+                graded[i, j] = True
+                bands[i, j] = band_lookup.get(grade.upper(), -1)
+    
+    school_codes, school_index = np.unique(
+        np.array(candidate_column(candidates, SCHOOL_FIELD), dtype=str), return_inverse=True
+    )
+    cells = len(school_codes) * s_count
+    cell = (school_index.reshape(-1, 1) * s_count + np.arange(s_count)).ravel()
+    
+    marks = marks.ravel()
+    bands = bands.ravel()
+    has_mark = ~np.isnan(marks)
+    appeared = has_mark | graded.ravel()
+    banded = bands >= 0
+    
+    appeared_count = np.bincount(cell[appeared], minlength=cells)
+    mark_count = np.bincount(cell[has_mark], minlength=cells)
+    mark_sum = np.bincount(cell[has_mark], weights=marks[has_mark], minlength=cells)
+    band_count = np.bincount(cell[banded] * b_count + bands[banded], minlength=cells * b_count)
+    band_count = band_count.reshape(cells, b_count)
+    passed_count = appeared_count - band_count[:, fail_band]
+    
+    shape = (len(school_codes), s_count)
+    subject_totals = [
+        array.reshape(shape + array.shape[1:]).sum(axis=0)
+        for array in (appeared_count, passed_count, mark_sum, mark_count, band_count)
+    ]
+    
+    subject_rows = []
+    for j, code in enumerate(subject_codes):
+        if subject_totals[0][j]:
+            stats = [total[j] for total in subject_totals]
+            subject_rows.append({'Subject': code, **_summary_row(*stats)})
+    
+    school_rows = []
+    for g, school_code in enumerate(school_codes):
+        for j, code in enumerate(subject_codes):
+            k = g * s_count + j
+            if appeared_count[k]:
+                school_rows.append({
+                    'School': str(school_code),
+                    'School Name': schools.get(str(school_code), ''),
+                    'Subject': code,
+                    **_summary_row(appeared_count[k], passed_count[k], mark_sum[k], mark_count[k], band_count[k])
+                })
+    
+    return {
+        'school_count': len(school_codes),
+        'subjects': subject_rows,
+        'schools': school_rows
+    }
+
+
+def get_result_summary(cached_data):
+    """Build the result summary on first use and keep it with the cached parse"""
+    if 'summary' not in cached_data:
+        cached_data['summary'] = build_result_summary(cached_data)
+    return cached_data['summary']
+
+
+def write_summary_sheets(writer, summary):
+    """Subject-wise summary sheet, plus a school-wise one for multi-school files"""
+    stat_columns = ['Appeared', 'Passed', 'Pass %', 'Mean'] + GRADE_BANDS
+    pd.DataFrame(summary['subjects'], columns=['Subject'] + stat_columns).to_excel(
+        writer, sheet_name='Subject Summary', index=False
+    )
+    if summary['school_count'] > 1:
+        pd.DataFrame(summary['schools'], columns=['School', 'School Name', 'Subject'] + stat_columns).to_excel(
+            writer, sheet_name='School Summary', index=False
+        )
+
+
 # Add this function after parse_and_cache_file function
 def remove_empty_columns_from_df(df):
     """Remove columns where all values are blank (empty strings, NaNs, or whitespace)."""
@@ -224,23 +1105,185 @@ def remove_empty_columns_from_df(df):
         # Return original dataframe if there's an error
         return df
 
+# Bulk roll-number handling: roll lists become sorted, deduplicated int64 arrays
+ROLL_PATTERN = re.compile(r'\d+')
+ROLL_SET_HEADERS = {'set', 'set name', 'section', 'group', 'sheet'}
+ROLL_HEADERS = {'roll', 'roll no', 'roll no.', 'roll number', 'rollno', 'roll_no', 'roll num'}
+ROLL_HEADER_WORD = re.compile(r'\broll\b', re.IGNORECASE)
+
+
+class RollListError(ValueError):
+    """An uploaded roll list that cannot be read (reported to the client as a 400)"""
+
+
+def roll_numbers_to_array(rolls):
+    """Deduplicate an iterable of roll numbers (str or int) into a sorted int64 array"""
+    if isinstance(rolls, np.ndarray):
+        return np.unique(rolls.astype(np.int64))
+    buffer = array('q', (int(roll) for roll in rolls if str(roll).strip().isdigit()))
+    return np.unique(np.frombuffer(buffer, dtype=np.int64))
+
+
+def parse_roll_text(text):
+    """Roll numbers separated by commas, newlines or other whitespace"""
+    return roll_numbers_to_array(ROLL_PATTERN.findall(text))
+
+
+def _sheet_roll_column(first_row):
+    """(column index, has header) for the roll column named in a header row.
+
+    An exact 'Roll No'-style header wins, then 'roll' as a word, and only then
+    any header containing 'roll', so 'Enrollment No' is not read ahead of 'Roll No'.
+    """
+    headers = [' '.join(value.lower().split()) if isinstance(value, str) else '' for value in first_row]
+    matchers = [
+        lambda header: header in ROLL_HEADERS,
+        lambda header: ROLL_HEADER_WORD.search(header),
+        lambda header: 'roll' in header
+    ]
+    for matches in matchers:
+        for idx, header in enumerate(headers):
+            if matches(header):
+                return idx, True
+    return 0, False
+
+
+def _csv_set_column(header, roll_column):
+    """Index of a set-name column named in the header (e.g. 'set,roll'), or None"""
+    for idx, value in enumerate(header):
+        if idx != roll_column and value.strip().lower() in ROLL_SET_HEADERS:
+            return idx
+    return None
+
+
+def read_roll_sets(file_storage):
+    """Stream an uploaded roll list into named roll sets.
+
+    TXT/CSV without a header: every run of digits in any cell is a roll number,
+    so rolls may be separated by commas, spaces, tabs or newlines as in pasted text.
+    CSV with a header: rolls come from the column whose header contains 'roll';
+    other columns are ignored unless one is headed 'set' (or section/group),
+    which then names the set each row belongs to.
+    XLSX: one set per sheet, read from the 'Roll No' column (or column A).
+    Returns a list of (name, roll array) in first-seen order.
+    """
+    extension = file_storage.filename.rsplit('.', 1)[-1].lower()
+    sets = {}
+    
+    if extension == 'xlsx':
+        # zipfile needs seekable(), which SpooledTemporaryFile only gained in 3.11; use the file it wraps
+        stream = getattr(file_storage.stream, '_file', file_storage.stream)
+        try:
+            workbook = load_workbook(stream, read_only=True, data_only=True)
+        except (zipfile.BadZipFile, InvalidFileException, KeyError) as e:
+            raise RollListError(f"Could not read roll list workbook: {e}")
+        try:
+            for ws in workbook.worksheets:
+                rows = ws.iter_rows(values_only=True)
+                first_row = next(rows, None)
+                if first_row is None:
+                    continue
+                column, has_header = _sheet_roll_column(first_row)
+                buffer = sets.setdefault(ws.title, array('q'))
+                for row in (rows if has_header else itertools.chain([first_row], rows)):
+                    value = row[column] if column < len(row) else None
+                    if isinstance(value, float) and value.is_integer():
+                        value = int(value)
+                    if value is not None and str(value).strip().isdigit():
+                        buffer.append(int(str(value).strip()))
+        finally:
+            workbook.close()
+    else:
+        # Decode line by line: on Python 3.10 the SpooledTemporaryFile behind an upload
+        # has no readable(), so it cannot be wrapped in io.TextIOWrapper
+        text = codecs.iterdecode(file_storage.stream, 'utf-8-sig', errors='replace')
+        rows = (row for row in csv.reader(text) if any(cell.strip() for cell in row))
+        first_row = next(rows, None)
+        if first_row is not None:
+            column, has_header = _sheet_roll_column(first_row)
+            set_column = _csv_set_column(first_row, column) if has_header else None
+            if not has_header:
+                rows = itertools.chain([first_row], rows)
+            
+            for row in rows:
+                if not has_header:
+                    rolls = [roll for cell in row for roll in ROLL_PATTERN.findall(cell)]
+                elif column < len(row):
+                    rolls = ROLL_PATTERN.findall(row[column])
+                else:
+                    continue
+                name = 'Rolls'
+                if set_column is not None and set_column < len(row) and row[set_column].strip():
+                    name = row[set_column].strip()
+                buffer = sets.setdefault(name, array('q'))
+                buffer.extend(int(roll) for roll in rolls)
+    
+    return [
+        (name, np.unique(np.frombuffer(buffer, dtype=np.int64)))
+        for name, buffer in sets.items() if len(buffer)
+    ]
+
+
+def read_request_roll_numbers(data, field):
+    """Roll numbers from an uploaded 'roll_file' or from a text field of the payload.
+
+    Returns (roll array, history fields); rolls are summarised by count rather than stored.
+    """
+    roll_file = request.files.get('roll_file')
+    if roll_file:
+        roll_sets = read_roll_sets(roll_file)
+        rolls = roll_numbers_to_array(np.concatenate([r for _, r in roll_sets])) if roll_sets else []
+        return rolls, {'roll_file': secure_filename(roll_file.filename), 'filter_roll_count': len(rolls)}
+    
+    rolls = parse_roll_text(data.get(field, '') or '')
+    return rolls, {'filter_roll_count': len(rolls)}
+
+
+def get_roll_index(cached_data):
+    """Candidate roll numbers as an int64 array, built once per cached parse"""
+    if 'roll_index' not in cached_data:
+        cached_data['roll_index'] = np.array([
+            int(roll_no) if roll_no.isdigit() else -1
+            for roll_no in candidate_column(cached_data['candidates'], 'Roll No')
+        ], dtype=np.int64)
+    return cached_data['roll_index']
+
+
+def select_candidates(cached_data, rolls):
+    """Row positions (in file order) of candidates whose roll number is in the roll array"""
+    if len(rolls) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.flatnonzero(np.isin(get_roll_index(cached_data), rolls, assume_unique=False))
+
+
+def excel_sheet_name(name, used):
+    """Excel-safe, unique sheet name (31 chars, no []:*?/\\)"""
+    base = re.sub(r'[\[\]:*?/\\]', '_', str(name)).strip() or 'Filter'
+    base = base[:31]
+    candidate = base
+    counter = 2
+    while candidate.lower() in used:
+        suffix = f"_{counter}"
+        candidate = base[:31 - len(suffix)] + suffix
+        counter += 1
+    used.add(candidate.lower())
+    return candidate
+
+
 # Fast filtering function for single filter
 def create_filtered_excel(cached_data, filter_roll_numbers, sheet_name="Filtered"):
     """Create Excel file with filtered data using cached parsed data"""
-    if not filter_roll_numbers:
+    if len(filter_roll_numbers) == 0:
         return None, 0
     
     # Filter candidates
-    filtered_candidates = [
-        candidate for candidate in cached_data['candidates']
-        if candidate['Roll No'] in filter_roll_numbers
-    ]
+    filtered_candidates = select_candidates(cached_data, roll_numbers_to_array(filter_roll_numbers))
     
-    if not filtered_candidates:
+    if len(filtered_candidates) == 0:
         return None, 0
     
     # Create DataFrame and remove empty columns
-    df_filtered = pd.DataFrame(filtered_candidates, columns=cached_data['columns'])
+    df_filtered = candidates_frame(cached_data, filtered_candidates)
     df_filtered = remove_empty_columns_from_df(df_filtered)
     
     # Create Excel file
@@ -283,8 +1326,11 @@ def create_filtered_excel(cached_data, filter_roll_numbers, sheet_name="Filtered
 
  
 # Multi-filter function for creating multiple sheets
-def create_multi_filtered_excel(cached_data, filter_sets):
-    """Create Excel file with multiple filtered sheets"""
+def create_multi_filtered_excel(cached_data, filter_sets, include_merit=False):
+    """Create Excel file with multiple filtered sheets.
+
+    Each set is either a text block of roll numbers or a (name, roll array) pair.
+    """
     if not filter_sets:
         return None, 0
     
@@ -293,39 +1339,43 @@ def create_multi_filtered_excel(cached_data, filter_sets):
     
     with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
         # First add all students sheet (keep all columns for reference)
-        df_all = pd.DataFrame(cached_data['candidates'], columns=cached_data['columns'])
+        df_all = candidates_frame(cached_data)
         df_all.to_excel(writer, sheet_name='All Students', index=False)
         
         sheets_created = 0
         total_filtered = 0
+        used_sheet_names = {'all students'}
         
         # Create filtered sheets
-        for idx, roll_block in enumerate(filter_sets, start=1):
-            # Parse roll numbers from block
-            rolls = [r.strip() for r in roll_block.replace(',', '\n').split('\n') if r.strip()]
-            if not rolls:
+        for idx, roll_set in enumerate(filter_sets, start=1):
+            # Parse roll numbers from block, or take a named set as-is
+            if isinstance(roll_set, str):
+                set_name, rolls = f"Filter_{idx}", parse_roll_text(roll_set)
+            else:
+                set_name, rolls = roll_set
+            if len(rolls) == 0:
                 continue
                 
             # Filter candidates
-            filtered_candidates = [
-                candidate for candidate in cached_data['candidates']
-                if candidate['Roll No'] in rolls
-            ]
+            filtered_candidates = select_candidates(cached_data, rolls)
             
-            if not filtered_candidates:
+            if len(filtered_candidates) == 0:
                 continue
                 
             # Create DataFrame and remove empty columns for this filtered set
-            df_filtered = pd.DataFrame(filtered_candidates, columns=cached_data['columns'])
+            df_filtered = candidates_frame(cached_data, filtered_candidates)
             df_filtered = remove_empty_columns_from_df(df_filtered)
             
             # Create sheet
-            sheet_name = f"Filter_{idx}"
+            sheet_name = excel_sheet_name(set_name, used_sheet_names)
             df_filtered.to_excel(writer, sheet_name=sheet_name, index=False)
             
             sheets_created += 1
             total_filtered += len(filtered_candidates)
         
+        if include_merit:
+            write_merit_sheet(writer, get_merit_index(cached_data))
+        
         # Apply formatting to all sheets
         workbook = writer.book
         for sheet_name in workbook.sheetnames:
@@ -359,28 +1409,17 @@ def create_multi_filtered_excel(cached_data, filter_sets):
     return output_file, sheets_created, total_filtered
 
 # Original text_to_excel function for full processing
-def text_to_excel(input_file, filter_roll_numbers=None):
+def text_to_excel(input_file, filter_roll_numbers=None, include_merit=False, include_summary=False):
     if filter_roll_numbers is None:
         filter_roll_numbers = []
     
     base_name = os.path.splitext(os.path.basename(input_file))[0]
     output_file = os.path.join(OUTPUT_FOLDER, f"{base_name}_{uuid.uuid4().hex[:8]}.xlsx")
     
-    with open(input_file, 'r', encoding='utf-8') as f:
-        lines = [line.rstrip('\n').rstrip('\r') for line in f.readlines()]
-    
-    all_subjects = set()
-    i = 0
-    while i < len(lines):
-        line = lines[i].strip()
-        if line and line[:8].strip().isdigit():
-            _, _, _, subjects, _, _ = parse_candidate_line(line)
-            all_subjects.update(subjects)
-        i += 1
+    # Reuse the cached parse instead of re-reading the file
+    cached_data = parse_and_cache_file(input_file)
+    candidates = cached_data['candidates']
     
-    subject_codes = sorted(all_subjects)
-    candidates = []
-    filtered_candidates = []
     stats = {
         'TOTAL': 0,
         'PASS': 0,
@@ -391,57 +1430,15 @@ def text_to_excel(input_file, filter_roll_numbers=None):
         'OTHER': 0
     }
     
-    i = 0
-    while i < len(lines):
-        line = lines[i].strip()
-        if line and line[:8].strip().isdigit():
-            stats['TOTAL'] += 1
-            roll_no, gender, name, subjects, result, comp_sub = parse_candidate_line(line)
-            
-            key = result if result in stats else 'OTHER'
-            if key in stats:
-                stats[key] += 1
-            
-            i += 1
-            marks_line = lines[i].strip() if i < len(lines) else ''
-            marks_and_grades = parse_marks_line(marks_line)
-            
-            candidate_data = {
-                'Roll No': roll_no,
-                'Gender': gender,
-                'Name': name
-            }
-            
-            for code in subject_codes:
-                candidate_data[f"{code}_Marks"] = ''
-                candidate_data[f"{code}_Grade"] = ''
-            
-            if result not in ['UFM', 'ABST']:
-                for subj, (mark, grade) in zip(subjects, marks_and_grades):
-                    if subj in subject_codes:
-                        candidate_data[f"{subj}_Marks"] = int(mark) if mark.isdigit() else mark
-                        candidate_data[f"{subj}_Grade"] = grade
-            
-            candidate_data['Result'] = result
-            candidate_data['Comp Sub'] = comp_sub
-            candidates.append(candidate_data)
-            
-            if roll_no in filter_roll_numbers:
-                filtered_candidates.append(candidate_data)
-        
-        i += 1
-    
-    columns = ['Roll No', 'Gender', 'Name']
-    for code in subject_codes:
-        columns.append(f"{code}_Marks")
-        columns.append(f"{code}_Grade")
-    columns.extend(['Result', 'Comp Sub'])
+    for result in candidate_column(candidates, 'Result'):
+        stats['TOTAL'] += 1
+        key = result if result in stats else 'OTHER'
+        stats[key] += 1
     
-    df = pd.DataFrame(candidates, columns=columns)
-    df_filtered = pd.DataFrame(filtered_candidates, columns=columns)
-
-
+    filtered_candidates = select_candidates(cached_data, roll_numbers_to_array(filter_roll_numbers))
     
+    df = candidates_frame(cached_data)
+    df_filtered = candidates_frame(cached_data, filtered_candidates)
     
     # Remove empty columns from filtered data only (keep all columns in "All Students")
     if len(filtered_candidates) > 0:
@@ -451,6 +1448,10 @@ def text_to_excel(input_file, filter_roll_numbers=None):
         df.to_excel(writer, sheet_name='All Students', index=False)
         if len(filtered_candidates) > 0:
             df_filtered.to_excel(writer, sheet_name='Filtered Students', index=False)
+        if include_merit:
+            write_merit_sheet(writer, get_merit_index(cached_data))
+        if include_summary:
+            write_summary_sheets(writer, get_result_summary(cached_data))
         
         workbook = writer.book
         for sheet_name in workbook.sheetnames:
@@ -500,15 +1501,26 @@ def upload_file():
             return jsonify({'error': 'Invalid file type. Only .txt files are allowed'}), 400
         
         filename = secure_filename(file.filename)
-        unique_filename = f"{uuid.uuid4().hex[:8]}_{filename}"
+        upload_id = uuid.uuid4().hex[:8]
+        unique_filename = f"{upload_id}_{filename}"
         filepath = os.path.join(UPLOAD_FOLDER, unique_filename)
         file.save(filepath)
         
         # Parse and cache the file immediately for fast filtering
         cached_data = parse_and_cache_file(filepath)
+        get_merit_index(cached_data)
         
-        session['uploaded_file'] = filepath
-        session['original_filename'] = filename
+        # Register the upload so every worker can find it
+        upload_registry[upload_id] = {
+            'timestamp': datetime.now().isoformat(),
+            'filepath': filepath,
+            'original_filename': filename,
+            'total_students': len(cached_data['candidates']),
+            'cache_key': file_cache_key(filepath),
+            'parsed_cache': parsed_cache_path(filepath)
+        }
+        
+        session['upload_id'] = upload_id
         
         return jsonify({
             'message': 'File uploaded and parsed successfully', 
@@ -524,26 +1536,27 @@ def upload_file():
 def filter_dynamic():
     """Handle dynamic filtering with real-time Excel creation"""
     try:
-        if 'uploaded_file' not in session:
+        upload_info = get_session_upload()
+        if upload_info is None:
             return jsonify({'error': 'No file uploaded'}), 400
         
-        filepath = session['uploaded_file']
+        filepath = upload_info['filepath']
         if not os.path.exists(filepath):
             return jsonify({'error': 'Uploaded file not found'}), 400
         
-        # Get roll numbers from request
-        data = request.get_json()
-        filter_text = data.get('roll_numbers', '')
+        # Get roll numbers from request: an uploaded roll list or pasted text
+        roll_file = request.files.get('roll_file')
+        if roll_file and not allowed_roll_file(roll_file.filename):
+            return jsonify({'error': 'Invalid roll list type. Only .txt, .csv and .xlsx files are allowed'}), 400
         
-        if not filter_text.strip():
-            return jsonify({'error': 'No roll numbers provided'}), 400
+        data = request.get_json(silent=True) or request.form
+        filter_roll_numbers, roll_source = read_request_roll_numbers(data, 'roll_numbers')
         
-        # Parse roll numbers
-        rolls = [roll.strip() for roll in filter_text.replace(',', '\n').split('\n')]
-        filter_roll_numbers = [roll for roll in rolls if roll]
+        if len(filter_roll_numbers) == 0:
+            return jsonify({'error': 'No roll numbers provided'}), 400
         
         # Get cached data
-        cached_data = parse_and_cache_file(filepath)
+        cached_data = parse_upload(upload_info)
         
         # Create filtered Excel
         output_file, filtered_count = create_filtered_excel(
@@ -559,10 +1572,10 @@ def filter_dynamic():
         process_id = uuid.uuid4().hex[:8]
         processing_history[process_id] = {
             'timestamp': datetime.now().isoformat(),
-            'original_filename': session.get('original_filename', 'unknown'),
+            'original_filename': upload_info['original_filename'],
             'output_file': output_file,
             'filtered_count': filtered_count,
-            'filter_roll_numbers': filter_roll_numbers,
+            **roll_source,
             'type': 'dynamic_filter'
         }
         
@@ -573,6 +1586,8 @@ def filter_dynamic():
             'message': f'Found {filtered_count} matching students'
         }), 200
         
+    except RollListError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -581,40 +1596,58 @@ def filter_dynamic():
 def filter_multi():
     """Handle multiple roll number sets and create multiple sheets"""
     try:
-        if 'uploaded_file' not in session:
+        upload_info = get_session_upload()
+        if upload_info is None:
             return jsonify({'error': 'No file uploaded'}), 400
         
-        filepath = session['uploaded_file']
+        filepath = upload_info['filepath']
         if not os.path.exists(filepath):
             return jsonify({'error': 'Uploaded file not found'}), 400
         
-        # Parse payload
-        data = request.get_json()
-        filter_sets = data.get('sets', [])
+        # Parse payload: pasted sets plus any named sets from an uploaded roll list
+        roll_file = request.files.get('roll_file')
+        if roll_file and not allowed_roll_file(roll_file.filename):
+            return jsonify({'error': 'Invalid roll list type. Only .txt, .csv and .xlsx files are allowed'}), 400
+        
+        data = request.get_json(silent=True)
+        if data is None:
+            data = request.form
+            text_sets = request.form.getlist('sets')
+        else:
+            text_sets = data.get('sets', [])
+        text_sets = [(f"Filter_{idx}", parse_roll_text(block)) for idx, block in enumerate(text_sets, start=1)]
+        file_sets = read_roll_sets(roll_file) if roll_file else []
+        filter_sets = text_sets + file_sets
         
         if not filter_sets:
             return jsonify({'error': 'No roll-number sets provided'}), 400
         
         # Get cached data
-        cached_data = parse_and_cache_file(filepath)
+        cached_data = parse_upload(upload_info)
         
         # Create multi-filtered Excel
-        output_file, sheets_created, total_filtered = create_multi_filtered_excel(cached_data, filter_sets)
+        output_file, sheets_created, total_filtered = create_multi_filtered_excel(
+            cached_data, filter_sets, include_merit=request_flag(data, 'include_merit')
+        )
         
         if not output_file:
             return jsonify({'error': 'No matching students found in any set'}), 404
         
-        # Store result
-        process_id = uuid.uuid4().hex[:8]
-        processing_history[process_id] = {
+        # Store result (roll sets are summarised by count, not stored)
+        process_info = {
             'timestamp': datetime.now().isoformat(),
-            'original_filename': session.get('original_filename', 'unknown'),
+            'original_filename': upload_info['original_filename'],
             'output_file': output_file,
             'sheets_created': sheets_created,
             'total_filtered': total_filtered,
-            'filter_sets': filter_sets,
+            'roll_sets': [{'name': name, 'count': len(rolls)} for name, rolls in filter_sets],
             'type': 'multi_filter'
         }
+        if roll_file:
+            process_info['roll_file'] = secure_filename(roll_file.filename)
+        
+        process_id = uuid.uuid4().hex[:8]
+        processing_history[process_id] = process_info
         
         return jsonify({
             'process_id': process_id,
@@ -624,57 +1657,145 @@ def filter_multi():
             'message': f'Created {sheets_created} filtered sheets with {total_filtered} total students'
         }), 200
         
+    except RollListError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/process', methods=['POST'])
 def process_file():
     try:
-        if 'uploaded_file' not in session:
+        upload_info = get_session_upload()
+        if upload_info is None:
             return jsonify({'error': 'No file uploaded'}), 400
         
-        filepath = session['uploaded_file']
+        filepath = upload_info['filepath']
         if not os.path.exists(filepath):
             return jsonify({'error': 'Uploaded file not found'}), 400
         
-        filter_text = request.json.get('filter_roll_numbers', '')
-        filter_roll_numbers = []
-        if filter_text.strip():
-            rolls = [roll.strip() for roll in filter_text.replace(',', '\n').split('\n')]
-            filter_roll_numbers = [roll for roll in rolls if roll]
+        roll_file = request.files.get('roll_file')
+        if roll_file and not allowed_roll_file(roll_file.filename):
+            return jsonify({'error': 'Invalid roll list type. Only .txt, .csv and .xlsx files are allowed'}), 400
+        
+        data = request.get_json(silent=True) or request.form
+        filter_roll_numbers, roll_source = read_request_roll_numbers(data, 'filter_roll_numbers')
         
-        output_file, stats, filtered_count = text_to_excel(filepath, filter_roll_numbers)
+        include_merit = request_flag(data, 'include_merit')
+        include_summary = request_flag(data, 'include_summary')
+        output_file, stats, filtered_count = text_to_excel(
+            filepath, filter_roll_numbers, include_merit, include_summary
+        )
         
         process_id = uuid.uuid4().hex[:8]
         processing_history[process_id] = {
             'timestamp': datetime.now().isoformat(),
-            'original_filename': session.get('original_filename', 'unknown'),
+            'original_filename': upload_info['original_filename'],
             'output_file': output_file,
             'stats': stats,
             'filtered_count': filtered_count,
-            'filter_roll_numbers': filter_roll_numbers,
+            **roll_source,
+            'include_merit': include_merit,
+            'include_summary': include_summary,
             'type': 'full_process'
         }
         
         session['last_process_id'] = process_id
         
-        return jsonify({
+        response = {
             'process_id': process_id,
             'stats': stats,
             'filtered_count': filtered_count,
             'message': 'File processed successfully'
+        }
+        if include_summary:
+            response['summary'] = get_result_summary(parse_upload(upload_info))
+        
+        return jsonify(response), 200
+        
+    except RollListError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/summary')
+def result_summary():
+    """Subject-wise and school-wise result analysis as JSON"""
+    try:
+        upload_info = get_session_upload()
+        if upload_info is None:
+            return jsonify({'error': 'No file uploaded'}), 400
+        
+        filepath = upload_info['filepath']
+        if not os.path.exists(filepath):
+            return jsonify({'error': 'Uploaded file not found'}), 400
+        
+        return jsonify(get_result_summary(parse_upload(upload_info))), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Merit list endpoints
+@app.route('/merit')
+def merit_list():
+    """Top-N merit list by best-five aggregate or by a single subject code, optionally within one school"""
+    try:
+        upload_info = get_session_upload()
+        if upload_info is None:
+            return jsonify({'error': 'No file uploaded'}), 400
+        
+        filepath = upload_info['filepath']
+        if not os.path.exists(filepath):
+            return jsonify({'error': 'Uploaded file not found'}), 400
+        
+        merit = get_merit_index(parse_upload(upload_info))
+        subject = request.args.get('subject', 'aggregate')
+        school = request.args.get('school')
+        top = request.args.get('top', 10, type=int)
+        
+        if subject not in merit.rankings:
+            return jsonify({'error': f'Unknown subject: {subject}'}), 400
+        if school is not None and school not in merit.school_rankings:
+            return jsonify({'error': f'Unknown school: {school}'}), 400
+        
+        return jsonify({
+            'subject': subject,
+            'school': school,
+            'ranked_students': merit.ranking_for(subject, school).count,
+            'students': merit.top(subject, max(top, 0), school)
         }), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/merit/<roll_no>')
+def merit_lookup(roll_no):
+    """Aggregate and per-subject rank and percentile, overall and within school, for one roll number"""
+    try:
+        upload_info = get_session_upload()
+        if upload_info is None:
+            return jsonify({'error': 'No file uploaded'}), 400
+        
+        filepath = upload_info['filepath']
+        if not os.path.exists(filepath):
+            return jsonify({'error': 'Uploaded file not found'}), 400
+        
+        merit = get_merit_index(parse_upload(upload_info))
+        result = merit.lookup(roll_no.strip())
+        if result is None:
+            return jsonify({'error': 'Roll number not found'}), 404
+        
+        return jsonify(result), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/download/<process_id>')
 def download_file(process_id):
     try:
-        if process_id not in processing_history:
+        process_info = processing_history.get(process_id)
+        if process_info is None:
             return jsonify({'error': 'Process not found'}), 404
         
-        process_info = processing_history[process_id]
         output_file = process_info['output_file']
         
         if not os.path.exists(output_file):
@@ -704,7 +1825,7 @@ def download_file(process_id):
 @app.route('/history')
 def get_history():
     try:
-        recent_history = dict(list(processing_history.items())[-10:])
+        recent_history = dict(processing_history.recent(10))
         return jsonify(recent_history), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -712,10 +1833,10 @@ def get_history():
 @app.route('/preview/<process_id>')
 def preview_data(process_id):
     try:
-        if process_id not in processing_history:
+        process_info = processing_history.get(process_id)
+        if process_info is None:
             return jsonify({'error': 'Process not found'}), 404
         
-        process_info = processing_history[process_id]
         output_file = process_info['output_file']
         
         if not os.path.exists(output_file):
@@ -740,23 +1861,21 @@ def preview_data(process_id):
 def delete_upload():
     """Delete the currently uploaded file and clear session data"""
     try:
-        if 'uploaded_file' not in session:
+        upload_info = get_session_upload()
+        if upload_info is None:
             return jsonify({'error': 'No file to delete'}), 400
         
-        filepath = session['uploaded_file']
+        # Clear this worker's file cache entry
+        evict_file_cache(upload_info['cache_key'])
         
-        # Delete the physical file if it exists
-        if os.path.exists(filepath):
-            os.remove(filepath)
-        
-        # Clear file cache entry
-        cache_key = f"{filepath}_{os.path.getmtime(filepath) if os.path.exists(filepath) else 0}"
-        if cache_key in file_cache:
-            del file_cache[cache_key]
+        # Delete the physical file and its persisted parse if they exist
+        for path in [upload_info['filepath'], upload_info['parsed_cache']]:
+            if os.path.exists(path):
+                os.remove(path)
         
-        # Clear session data
-        session.pop('uploaded_file', None)
-        session.pop('original_filename', None)
+        # Clear shared upload metadata and session data
+        upload_registry.pop(session['upload_id'], None)
+        session.pop('upload_id', None)
         session.pop('last_process_id', None)
         
         return jsonify({
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+ASGI entry point for the Flask grade processing app
+
+Serves the same Flask app from an asyncio server so slow clients do not
+pin a worker: request bodies are read asynchronously before the app runs,
+and responses such as downloads are streamed back chunk by chunk.
+
+CPU-heavy routes (upload parsing, /process, /filter_*) run on a bounded
+process pool, so exports use several cores and never hold the GIL that
+light routes (/, /download, /preview, /history, ...) need. Light routes run
+on their own thread pool and do not queue behind exports. With the
+single-process memory state store, heavy routes fall back to a separate
+bounded thread pool, since child processes could not see that state.
+
+Run with:
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+or under gunicorn:
+    gunicorn asgi:application -k uvicorn.workers.UvicornWorker
+"""
+import asyncio
+import io
+import multiprocessing
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from werkzeug.wsgi import FileWrapper
+
+from app import app, state_store, MemoryStateStore
+
+# Threads running light Flask requests (pages, downloads, previews, history)
+APP_WORKERS = int(os.environ.get('ASGI_APP_WORKERS', 16))
+# Processes running parse/export requests; the bound on concurrent CPU-heavy work
+EXPORT_WORKERS = int(os.environ.get('ASGI_EXPORT_WORKERS', os.cpu_count() or 1))
+EXPORT_ROUTES = {'/upload', '/process', '/filter_dynamic', '/filter_multi'}
+# Threads reading response chunks (e.g. send_file) so streaming never waits behind exports
+IO_WORKERS = int(os.environ.get('ASGI_IO_WORKERS', 16))
+STREAM_CHUNK_SIZE = 64 * 1024
+BODY_SPOOL_SIZE = 1024 * 1024  # Request bodies above this spill to a temp file
+
+
+def run_buffered(environ, body):
+    """Run one request in an export process; the response is returned whole"""
+    environ = dict(environ, **{'wsgi.input': io.BytesIO(body), 'wsgi.errors': sys.stderr})
+    response = {}
+    chunks = []
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = [
+            (name.lower().encode('latin-1'), value.encode('latin-1'))
+            for name, value in headers
+        ]
+        return chunks.append
+
+    result = app(environ, start_response)
+    try:
+        chunks.extend(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return response['status'], response['headers'], b''.join(chunks)
+
+
+class AsyncWSGIAdapter:
+    """Minimal ASGI -> WSGI bridge with bounded executors"""
+
+    def __init__(self, wsgi_app, app_workers=APP_WORKERS, io_workers=IO_WORKERS,
+                 export_workers=EXPORT_WORKERS):
+        self.wsgi_app = wsgi_app
+        self.app_executor = ThreadPoolExecutor(app_workers, thread_name_prefix='asgi-app')
+        self.io_executor = ThreadPoolExecutor(io_workers, thread_name_prefix='asgi-io')
+        self.export_workers = export_workers
+        self._export_executor = None
+
+    @property
+    def export_executor(self):
+        # Created on first use: export processes import this module and must not build pools of their own
+        if self._export_executor is None:
+            if isinstance(state_store, MemoryStateStore):
+                self._export_executor = ThreadPoolExecutor(self.export_workers, thread_name_prefix='asgi-export')
+            else:
+                # spawn, not fork: the parent has threads and pooled database connections
+                self._export_executor = ProcessPoolExecutor(
+                    self.export_workers, mp_context=multiprocessing.get_context('spawn')
+                )
+        return self._export_executor
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            await self.handle_http(scope, receive, send)
+        elif scope['type'] == 'lifespan':
+            await self.handle_lifespan(receive, send)
+
+    async def handle_lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.app_executor.shutdown(wait=True)
+                self.io_executor.shutdown(wait=True)
+                if self._export_executor is not None:
+                    self._export_executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def handle_http(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        body = tempfile.SpooledTemporaryFile(max_size=BODY_SPOOL_SIZE)
+        try:
+            # Read the whole upload without holding an app thread
+            limit = self.wsgi_app.config.get('MAX_CONTENT_LENGTH')
+            size = 0
+            more_body = True
+            while more_body:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                chunk = message.get('body', b'')
+                size += len(chunk)
+                if limit is not None and size > limit:
+                    await self.send_simple(send, 413, b'Request body too large')
+                    return
+                if chunk:
+                    await loop.run_in_executor(self.io_executor, body.write, chunk)
+                more_body = message.get('more_body', False)
+            body.seek(0)
+
+            if scope['method'] == 'POST' and scope['path'] in EXPORT_ROUTES:
+                await self.handle_export(scope, body, size, send)
+                return
+
+            environ = self.build_environ(scope, body, size)
+            response = {}
+
+            def start_response(status, headers, exc_info=None):
+                response['status'] = int(status.split(' ', 1)[0])
+                response['headers'] = [
+                    (name.lower().encode('latin-1'), value.encode('latin-1'))
+                    for name, value in headers
+                ]
+                return response.setdefault('written', []).append
+
+            result = await loop.run_in_executor(
+                self.app_executor, self.wsgi_app, environ, start_response
+            )
+            await self.stream_response(result, response, receive, send)
+        finally:
+            body.close()
+
+    async def handle_export(self, scope, body, size, send):
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(self.io_executor, body.read)
+        # Only plain values cross the process boundary; the child supplies its own input stream
+        environ = {
+            key: value for key, value in self.build_environ(scope, None, size).items()
+            if key not in ('wsgi.input', 'wsgi.errors', 'wsgi.file_wrapper')
+        }
+        status, headers, content = await loop.run_in_executor(
+            self.export_executor, run_buffered, environ, data
+        )
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': content})
+
+    async def stream_response(self, result, response, receive, send):
+        loop = asyncio.get_running_loop()
+        disconnected = asyncio.Event()
+
+        async def watch_disconnect():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            disconnected.set()
+
+        watcher = asyncio.ensure_future(watch_disconnect())
+        iterator = iter(result)
+        try:
+            # Headers are only final once the first chunk has been produced
+            first = await loop.run_in_executor(self.io_executor, next, iterator, None)
+            await send({
+                'type': 'http.response.start',
+                'status': response['status'],
+                'headers': response['headers']
+            })
+            for chunk in response.get('written', []):
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+
+            chunk = first
+            while chunk is not None and not disconnected.is_set():
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                chunk = await loop.run_in_executor(self.io_executor, next, iterator, None)
+            if not disconnected.is_set():
+                await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            watcher.cancel()
+            if hasattr(result, 'close'):
+                await loop.run_in_executor(self.io_executor, result.close)
+
+    @staticmethod
+    async def send_simple(send, status, body):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'text/plain'), (b'content-length', str(len(body)).encode())]
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    @staticmethod
+    def build_environ(scope, body, size):
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client')
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': str(server[0]),
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0] if client else '',
+            'CONTENT_LENGTH': str(size),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+            # Larger blocks for send_file so downloads need fewer executor hops
+            'wsgi.file_wrapper': lambda f, buffer_size=8192: FileWrapper(f, max(buffer_size, STREAM_CHUNK_SIZE)),
+        }
+        for raw_name, raw_value in scope.get('headers', []):
+            name = raw_name.decode('latin-1').upper().replace('-', '_')
+            value = raw_value.decode('latin-1')
+            if name == 'CONTENT_TYPE':
+                environ['CONTENT_TYPE'] = value
+                continue
+            if name == 'CONTENT_LENGTH':
+                continue
+            key = f"HTTP_{name}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+        return environ
+
+
+application = AsyncWSGIAdapter(app)
@@ -0,0 +1,500 @@
+#!/usr/bin/env python3
+"""
+Load-test harness for the Flask grade processing app
+
+Simulated users upload a synthetic gazette and then hit /filter_dynamic,
+/filter_multi, /process, /preview and /download in a weighted mix. Reports
+p50/p95/p99 latency and throughput per endpoint, plus worker RSS and the
+disk used by uploads/output/state: per endpoint as the change across each
+request, and for the whole run as peak/final totals.
+
+By default the per-endpoint changes come from the background sampler's
+timeline: the last sample before a request starts against the first one
+after it ends. That costs nothing on the request path, but a request is
+charged for everything else that happened in its sampling window.
+--per-request-resources samples right before and after every request
+instead. That is exact with --users 1, but it walks the data folders twice
+per request in the user threads, which slows the load it is measuring.
+Either way, with concurrent users read the changes as averages over many
+requests rather than per-request costs.
+
+Examples:
+    # In-process, through the Flask test client
+    python loadtest.py --users 8 --duration 30 --candidates 5000
+
+    # Against a running server (e.g. gunicorn -w 4 app:app)
+    python loadtest.py --url http://localhost:8000 --users 16 --worker-pattern gunicorn
+
+    # Custom mix, saved for comparing engine/cache options
+    python loadtest.py --mix filter_dynamic=5,process=1,download=2 --json results.json
+"""
+import argparse
+import bisect
+import http.cookiejar
+import io
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MIX = 'filter_dynamic=4,filter_multi=2,process=1,preview=2,download=2,upload=1'
+SUBJECT_POOL = ['041', '042', '043', '083', '030', '027', '028', '048', '065']
+GRADES = ['A1', 'A2', 'B1', 'B2', 'C1', 'C2', 'D1', 'D2', 'E']
+RESULTS = ['PASS'] * 16 + ['COMP', 'ESSENTIAL REPEAT', 'ABST', 'UFM']
+
+
+def generate_gazette(path, candidates, schools=1, seed=0):
+    """Write a synthetic fixed-width gazette and return its roll numbers"""
+    rng = random.Random(seed)
+    rolls = []
+    per_school = max(1, candidates // schools)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('CENTRAL BOARD OF SECONDARY EDUCATION - RESULT GAZETTE\n\n')
+        for i in range(candidates):
+            if i % per_school == 0:
+                school = 10000 + i // per_school
+                f.write(f"SCHOOL : - {school} SYNTHETIC SCHOOL {chr(65 + (i // per_school) % 26)}\n\n")
+            roll = str(20000000 + i)
+            rolls.append(roll)
+            subjects = ['301'] + rng.sample(SUBJECT_POOL, 5)
+            result = rng.choice(RESULTS)
+            name = ' '.join(''.join(rng.choice('ABCDEFGHIJKLMNOPRSTUVY') for _ in range(rng.randint(3, 8)))
+                            for _ in range(rng.randint(2, 3)))
+            comp = f" {subjects[1]}" if result == 'COMP' else ''
+            f.write(f"{roll}   {rng.choice('MF')}   {name:<30} {' '.join(subjects)} 500 502   {result}{comp}\n")
+            if result not in ('ABST', 'UFM'):
+                marks = ' '.join(f"{rng.randint(15, 100):03d} {rng.choice(GRADES)}" for _ in subjects)
+                f.write(f"            {marks} {rng.choice(GRADES)} {rng.choice(GRADES)}\n")
+            else:
+                f.write('\n')
+    return rolls
+
+
+def encode_multipart(fields, files):
+    """Multipart body for urllib; files are (field, filename, bytes)"""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        )
+    for name, filename, content in files:
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'.encode() + content + b'\r\n'
+        )
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+class TestClientSession:
+    """One simulated user talking to the app in-process"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, json_body=None, files=None):
+        kwargs = {}
+        if json_body is not None:
+            kwargs['json'] = json_body
+        if files:
+            kwargs['data'] = {name: (io.BytesIO(content), filename) for name, filename, content in files}
+            kwargs['content_type'] = 'multipart/form-data'
+        response = self.client.open(path, method=method, **kwargs)
+        return response.status_code, response.get_data()
+
+
+class HttpSession:
+    """One simulated user talking to a running server, with its own cookie jar"""
+
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+
+    def request(self, method, path, json_body=None, files=None):
+        headers = {}
+        data = None
+        if json_body is not None:
+            data = json.dumps(json_body).encode()
+            headers['Content-Type'] = 'application/json'
+        if files:
+            data, headers['Content-Type'] = encode_multipart({}, files)
+        req = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        try:
+            with self.opener.open(req, timeout=self.timeout) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+
+class Recorder:
+    """Thread-safe per-endpoint latency and status collection"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+
+    def record(self, endpoint, started, seconds, status, size, deltas=None):
+        """deltas is (RSS kB, disk bytes) when sampled per request, else taken from the timeline later"""
+        with self.lock:
+            entry = self.samples.setdefault(endpoint, {
+                'latencies': [], 'errors': 0, 'bytes': 0, 'spans': [], 'deltas': []
+            })
+            entry['latencies'].append(seconds)
+            entry['bytes'] += size
+            entry['spans'].append((started, started + seconds))
+            if deltas is not None:
+                entry['deltas'].append(deltas)
+            if status >= 400:
+                entry['errors'] += 1
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, math.ceil(pct / 100.0 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def read_rss_kb(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def find_worker_pids(pattern):
+    """PIDs whose command line contains pattern (Linux /proc only)"""
+    pids = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit() or int(entry) == os.getpid():
+            continue
+        try:
+            with open(f'/proc/{entry}/cmdline', 'rb') as f:
+                cmdline = f.read().replace(b'\x00', b' ').decode(errors='replace')
+        except OSError:
+            continue
+        if pattern in cmdline and 'loadtest.py' not in cmdline:
+            pids.append(int(entry))
+    return pids
+
+
+def disk_usage_bytes(folders):
+    total = 0
+    for folder in folders:
+        for root, _, files in os.walk(folder):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+    return total
+
+
+class ResourceSampler(threading.Thread):
+    """Samples total worker RSS and data-folder disk usage while the test runs"""
+
+    def __init__(self, pids, folders, interval=0.5):
+        super().__init__(daemon=True)
+        self.pids = pids
+        self.folders = folders
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.worker_pids = pids()
+        self.sample_times = []
+        self.timeline = []
+        self.peak_rss_kb = 0
+        self.peak_disk = 0
+        self.last_rss_kb = 0
+        self.last_disk = 0
+
+    def snapshot(self):
+        """(worker RSS kB, disk bytes) now; worker PIDs are refreshed by the sampling loop"""
+        return sum(read_rss_kb(pid) for pid in self.worker_pids), disk_usage_bytes(self.folders)
+
+    def sample(self):
+        self.worker_pids = self.pids()
+        self.last_rss_kb, self.last_disk = self.snapshot()
+        self.sample_times.append(time.perf_counter())
+        self.timeline.append((self.last_rss_kb, self.last_disk))
+        self.peak_rss_kb = max(self.peak_rss_kb, self.last_rss_kb)
+        self.peak_disk = max(self.peak_disk, self.last_disk)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            self.sample()
+            self.stop_event.wait(self.interval)
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+        self.sample()
+
+    def delta(self, started, finished):
+        """(RSS kB, disk bytes) change between the samples bracketing a request"""
+        before = self.timeline[max(bisect.bisect_right(self.sample_times, started) - 1, 0)]
+        after = self.timeline[min(bisect.bisect_left(self.sample_times, finished), len(self.timeline) - 1)]
+        return after[0] - before[0], after[1] - before[1]
+
+
+class SimulatedUser(threading.Thread):
+    """Uploads a gazette, then issues weighted requests until the deadline"""
+
+    def __init__(self, session, gazette, rolls, mix, recorder, sampler, deadline, rng, think_time,
+                 per_request_resources=False):
+        super().__init__(daemon=True)
+        self.session = session
+        self.gazette = gazette
+        self.rolls = rolls
+        self.endpoints = list(mix)
+        self.weights = [mix[name] for name in self.endpoints]
+        self.recorder = recorder
+        self.sampler = sampler
+        self.per_request_resources = per_request_resources
+        self.deadline = deadline
+        self.rng = rng
+        self.think_time = think_time
+        self.process_ids = []
+        self.uploaded = False
+
+    def call(self, endpoint, method, path, json_body=None, files=None):
+        # Opt-in exact sampling happens outside the timed span so it does not inflate latency
+        before = self.sampler.snapshot() if self.per_request_resources else None
+        start = time.perf_counter()
+        try:
+            status, body = self.session.request(method, path, json_body, files)
+        except Exception as e:
+            print(f"{endpoint} failed: {e}", file=sys.stderr)
+            status, body = 599, b''
+        seconds = time.perf_counter() - start
+        deltas = None
+        if before is not None:
+            after = self.sampler.snapshot()
+            deltas = (after[0] - before[0], after[1] - before[1])
+        self.recorder.record(endpoint, start, seconds, status, len(body), deltas)
+        return status, body
+
+    def sample_rolls(self, count):
+        return ', '.join(self.rng.sample(self.rolls, min(count, len(self.rolls))))
+
+    def upload(self):
+        # Drop the previous upload first (untimed) so re-uploads do not pile up on disk
+        if self.uploaded:
+            self.session.request('POST', '/delete_upload')
+        self.call('upload', 'POST', '/upload', files=[('file', 'gazette.txt', self.gazette)])
+        self.uploaded = True
+
+    def remember(self, status, body):
+        if status == 200:
+            process_id = json.loads(body).get('process_id')
+            if process_id:
+                self.process_ids.append(process_id)
+
+    def run_endpoint(self, endpoint):
+        if endpoint in ('preview', 'download') and not self.process_ids:
+            endpoint = 'filter_dynamic'
+
+        if endpoint == 'upload':
+            self.upload()
+        elif endpoint == 'filter_dynamic':
+            body = {'roll_numbers': self.sample_rolls(self.rng.randint(5, 200))}
+            self.remember(*self.call(endpoint, 'POST', '/filter_dynamic', body))
+        elif endpoint == 'filter_multi':
+            body = {'sets': [self.sample_rolls(self.rng.randint(5, 100)) for _ in range(self.rng.randint(2, 5))]}
+            self.remember(*self.call(endpoint, 'POST', '/filter_multi', body))
+        elif endpoint == 'process':
+            body = {
+                'filter_roll_numbers': self.sample_rolls(20),
+                'include_merit': self.rng.random() < 0.5,
+                'include_summary': self.rng.random() < 0.5
+            }
+            self.remember(*self.call(endpoint, 'POST', '/process', body))
+        elif endpoint in ('preview', 'download'):
+            process_id = self.rng.choice(self.process_ids)
+            self.call(endpoint, 'GET', f'/{endpoint}/{process_id}')
+
+    def run(self):
+        self.upload()
+        while time.monotonic() < self.deadline:
+            self.run_endpoint(self.rng.choices(self.endpoints, self.weights)[0])
+            if self.think_time:
+                time.sleep(self.rng.uniform(0, self.think_time))
+
+    def cleanup(self):
+        for process_id in self.process_ids:
+            self.session.request('POST', f'/delete_history_item/{process_id}')
+        self.session.request('POST', '/delete_upload')
+
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(','):
+        if not item.strip():
+            continue
+        name, _, weight = item.partition('=')
+        mix[name.strip()] = float(weight or 1)
+    unknown = set(mix) - {'upload', 'filter_dynamic', 'filter_multi', 'process', 'preview', 'download'}
+    if unknown:
+        raise SystemExit(f"Unknown endpoints in --mix: {', '.join(sorted(unknown))}")
+    return mix
+
+
+def build_report(recorder, elapsed, sampler):
+    endpoints = {}
+    total_requests = 0
+    for endpoint, entry in sorted(recorder.samples.items()):
+        latencies = sorted(entry['latencies'])
+        deltas = entry['deltas'] or [sampler.delta(started, finished) for started, finished in entry['spans']]
+        rss_deltas = [rss for rss, _ in deltas]
+        disk_deltas = [disk for _, disk in deltas]
+        total_requests += len(latencies)
+        endpoints[endpoint] = {
+            'requests': len(latencies),
+            'errors': entry['errors'],
+            'throughput_rps': round(len(latencies) / elapsed, 2),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+            'response_bytes': entry['bytes'],
+            'worker_rss_delta_mb': {
+                'mean': round(sum(rss_deltas) / len(rss_deltas) / 1024, 2),
+                'max': round(max(rss_deltas) / 1024, 2),
+                'total': round(sum(rss_deltas) / 1024, 2)
+            },
+            'disk_delta_mb': {
+                'mean': round(sum(disk_deltas) / len(disk_deltas) / 1e6, 3),
+                'max': round(max(disk_deltas) / 1e6, 3),
+                'total': round(sum(disk_deltas) / 1e6, 3)
+            }
+        }
+    return {
+        'elapsed_s': round(elapsed, 2),
+        'total_requests': total_requests,
+        'throughput_rps': round(total_requests / elapsed, 2),
+        'worker_rss_mb': {'peak': round(sampler.peak_rss_kb / 1024, 1), 'final': round(sampler.last_rss_kb / 1024, 1)},
+        'disk_mb': {'peak': round(sampler.peak_disk / 1e6, 2), 'final': round(sampler.last_disk / 1e6, 2)},
+        'resource_deltas': 'per_request' if any(e['deltas'] for e in recorder.samples.values()) else 'sampler_timeline',
+        'endpoints': endpoints
+    }
+
+
+def print_report(report):
+    print(f"\n{'endpoint':<16}{'reqs':>7}{'errs':>6}{'rps':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'resp MB':>10}"
+          f"{'RSS+ MB':>10}{'RSS+ max':>10}{'disk+ MB':>10}{'disk+ tot':>11}")
+    for endpoint, stats in report['endpoints'].items():
+        print(f"{endpoint:<16}{stats['requests']:>7}{stats['errors']:>6}{stats['throughput_rps']:>8}"
+              f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}"
+              f"{stats['response_bytes'] / 1e6:>10.2f}"
+              f"{stats['worker_rss_delta_mb']['mean']:>10.2f}{stats['worker_rss_delta_mb']['max']:>10.2f}"
+              f"{stats['disk_delta_mb']['mean']:>10.3f}{stats['disk_delta_mb']['total']:>11.3f}")
+    source = 'sampled around each request' if report['resource_deltas'] == 'per_request' else 'from the background sampler'
+    print(f"(RSS+/disk+: mean change across one request, {source}; max and total over all requests to that endpoint)")
+    print(f"\nTotal: {report['total_requests']} requests in {report['elapsed_s']}s "
+          f"({report['throughput_rps']} req/s)")
+    print(f"Worker RSS: peak {report['worker_rss_mb']['peak']} MB, final {report['worker_rss_mb']['final']} MB")
+    print(f"Disk (uploads/output/state): peak {report['disk_mb']['peak']} MB, final {report['disk_mb']['final']} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Drive the grade processing app with concurrent simulated users')
+    parser.add_argument('--url', help='Base URL of a running server; default runs in-process via the Flask test client')
+    parser.add_argument('--users', type=int, default=4, help='Concurrent simulated users')
+    parser.add_argument('--duration', type=float, default=20, help='Seconds each user keeps issuing requests')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='Weighted endpoint mix, e.g. filter_dynamic=4,process=1')
+    parser.add_argument('--candidates', type=int, default=2000, help='Candidates in the synthetic gazette')
+    parser.add_argument('--schools', type=int, default=1, help='Schools in the synthetic gazette')
+    parser.add_argument('--gazette', help='Use an existing gazette file instead of a synthetic one')
+    parser.add_argument('--think-time', type=float, default=0.0, help='Max random pause between requests (s)')
+    parser.add_argument('--timeout', type=float, default=120, help='HTTP timeout in --url mode (s)')
+    parser.add_argument('--state-backend', choices=['sqlite', 'redis', 'memory'],
+                        help='STATE_BACKEND for the in-process app')
+    parser.add_argument('--worker-pattern', default='gunicorn',
+                        help='Command-line substring identifying server workers for RSS in --url mode')
+    parser.add_argument('--app-dir', default=APP_DIR, help='Directory holding uploads/output/state for disk usage')
+    parser.add_argument('--sample-interval', type=float, default=0.5,
+                        help='Seconds between background RSS/disk samples')
+    parser.add_argument('--per-request-resources', action='store_true',
+                        help='Sample RSS/disk around every request (exact, but adds work in the user threads)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--keep-files', action='store_true', help='Leave uploads, outputs and history behind')
+    parser.add_argument('--json', help='Also write the report as JSON to this path')
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+
+    if args.gazette:
+        gazette_path = args.gazette
+        with open(gazette_path, 'rb') as f:
+            rolls = sorted({line[:8].decode(errors='replace').strip() for line in f
+                            if line[:8].strip().isdigit()})
+    else:
+        gazette_path = os.path.join(tempfile.mkdtemp(prefix='cbse_loadtest_'), 'gazette.txt')
+        rolls = generate_gazette(gazette_path, args.candidates, args.schools, args.seed)
+    with open(gazette_path, 'rb') as f:
+        gazette = f.read()
+
+    if args.url:
+        make_session = lambda: HttpSession(args.url, args.timeout)
+        worker_pids = lambda: find_worker_pids(args.worker_pattern)
+    else:
+        # The app uses folders relative to its own directory
+        os.chdir(APP_DIR)
+        sys.path.insert(0, APP_DIR)
+        if args.state_backend:
+            os.environ['STATE_BACKEND'] = args.state_backend
+        from app import app
+        make_session = lambda: TestClientSession(app)
+        worker_pids = lambda: [os.getpid()]
+
+    folders = [os.path.join(args.app_dir, name) for name in ('uploads', 'output', 'state')]
+    print(f"Gazette: {len(rolls)} candidates, {len(gazette) / 1e6:.2f} MB; "
+          f"{args.users} users for {args.duration}s; mix {mix}")
+
+    recorder = Recorder()
+    sampler = ResourceSampler(worker_pids, folders, args.sample_interval)
+    sampler.start()
+
+    start = time.monotonic()
+    deadline = start + args.duration
+    users = [
+        SimulatedUser(make_session(), gazette, rolls, mix, recorder, sampler, deadline,
+                      random.Random(args.seed + i), args.think_time, args.per_request_resources)
+        for i in range(args.users)
+    ]
+    for user in users:
+        user.start()
+    for user in users:
+        user.join()
+    elapsed = time.monotonic() - start
+    sampler.stop()
+
+    report = build_report(recorder, elapsed, sampler)
+    print_report(report)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if not args.keep_files:
+        for user in users:
+            user.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Parity check for the gazette parser
+
+Compares app.parse_gazette (memory-mapped, bytes tokenised) against a
+reference copy of the original text-mode parser, on built-in edge-case
+gazettes and on any gazette files given on the command line. Also checks
+that a parse written to and loaded back from the .cbsecol cache is unchanged.
+
+Examples:
+    python parser_check.py
+    python parser_check.py uploads/*.txt
+"""
+import argparse
+import os
+import re
+import shutil
+import sys
+import tempfile
+
+import app
+
+REFERENCE_SCHOOL_HEADER = re.compile(r'^SCHOOL\s*(?:CODE|NO\.?)?\s*:?\s*-?\s*(\d{5})\b\s*(.*)$', re.IGNORECASE)
+
+# Each fixture targets one tokenising rule the bytes parser has to reproduce
+FIXTURES = {
+    'crlf_and_results': (
+        "RESULT GAZETTE\r\n"
+        "SCHOOL : - 11111 EDGE SCHOOL\r\n"
+        "30000001 M  RAHUL KUMAR   301 041 042 043 083  ESSENTIAL REPEAT 041 042\r\n"
+        " 033 E 020 E 50 C1 60 B2 0-5 D1\r\n"
+        "30000002 F ÅSA Ñ   301 041  ABST\r\n"
+        "30000003 F NEXT ONE 301 041 COMP 041\r\n"
+        "  088 A2 0 E\r\n"
+        "12345 X\r\n"
+        "30000004\r\n"
+        "\r\n"
+        "30000005 M LAST 301 041 PASS\n"
+        " 099 A1 088"
+    ),
+    'unicode_whitespace': (
+        "SCHOOL CODE: 22222 \u00a0SAINT JOSEPH'S SCHOOL\u00a0\n"
+        "30000011 M JOSÉ\u00a0MARÍA KUMAR 301 041 042 PASS\n"
+        " 077 B1\u00a0065 C1 081 A2\n"
+        "30000012 F ANNA\u2003LEE\u00a0 301 041 COMP\u00a0041\n"
+        " 055 C2 033 E\n"
+    ),
+    'unicode_line_edges': (
+        "\u3000SCHOOL CODE:\u00a055555 IDEOGRAPHIC SPACE SCHOOL\n"
+        "\u00a030000013 M LEADING SPACE 301 083 PASS\n"
+        " 070 B2 060 C1\n"
+        "30000014\u00a0M GENDER GAP 301 041 PASS\n"
+        " 066 C1 071 B2\n"
+        "3000015\u00a0F SHORT ROLL 301 PASS\n"
+        "\u2002050 C2\n"
+        "30000016 \u00c9 ODD GENDER 301 PASS\n"
+        " 045 D1\n"
+    ),
+    'school_changes': (
+        "SCHOOL NO. 33333 FIRST SCHOOL\n"
+        "30000021 M ONE 301 PASS\n"
+        " 070 B2\n"
+        "school : - 44444\n"
+        "30000022 F TWO 301 083 UFM\n"
+        " 070 B2 060 C1\n"
+    ),
+    'empty': '',
+}
+
+
+def reference_candidate_line(line):
+    roll_no = line[:8].strip()
+    remaining = line[8:].lstrip()
+    if not remaining:
+        return roll_no, '', '', [], '', ''
+
+    gender = remaining[0]
+    parts = remaining[1:].lstrip().split()
+    name_parts = []
+    subjects = []
+    result = ''
+    comp_sub = []
+    found_subject = False
+
+    i = 0
+    while i < len(parts):
+        token = parts[i]
+        if len(token) == 3 and token.isdigit():
+            found_subject = True
+            subjects.append(token)
+        elif not found_subject:
+            name_parts.append(token)
+        else:
+            if token == 'ESSENTIAL' and i + 1 < len(parts) and parts[i+1] == 'REPEAT':
+                result = 'ESSENTIAL REPEAT'
+                comp_sub = parts[i+2:]
+                break
+            elif token in ['PASS', 'COMP', 'UFM', 'ABST', 'REPEAT']:
+                result = token
+                comp_sub = parts[i+1:]
+                break
+        i += 1
+
+    return roll_no, gender, ' '.join(name_parts), subjects, result, ' '.join(comp_sub)
+
+
+def reference_marks_line(line):
+    tokens = line.split()
+    marks_and_grades = []
+
+    i = 0
+    while i < len(tokens):
+        if tokens[i].replace('-', '').isdigit():
+            mark = tokens[i].lstrip('0') or '0'
+            grade = tokens[i+1] if i + 1 < len(tokens) else ''
+            marks_and_grades.append((mark, grade))
+            i += 2
+        else:
+            i += 1
+
+    return marks_and_grades
+
+
+def reference_parse(input_file):
+    """The original two-pass text-mode parser, kept as the parity reference"""
+    with open(input_file, 'r', encoding='utf-8') as f:
+        lines = [line.rstrip('\n').rstrip('\r') for line in f.readlines()]
+
+    subject_codes = sorted({
+        subj
+        for line in (raw.strip() for raw in lines)
+        if line and line[:8].strip().isdigit()
+        for subj in reference_candidate_line(line)[3]
+    })
+
+    candidates = []
+    schools = {}
+    school_code = ''
+    i = 0
+    while i < len(lines):
+        line = lines[i].strip()
+        school_match = REFERENCE_SCHOOL_HEADER.match(line)
+        if school_match:
+            school_code = school_match.group(1)
+            schools[school_code] = school_match.group(2).strip()
+        elif line and line[:8].strip().isdigit():
+            roll_no, gender, name, subjects, result, comp_sub = reference_candidate_line(line)
+            i += 1
+            marks_line = lines[i].strip() if i < len(lines) else ''
+
+            candidate_data = {'Roll No': roll_no, 'Gender': gender, 'Name': name}
+            for code in subject_codes:
+                candidate_data[f"{code}_Marks"] = ''
+                candidate_data[f"{code}_Grade"] = ''
+            if result not in ['UFM', 'ABST']:
+                for subj, (mark, grade) in zip(subjects, reference_marks_line(marks_line)):
+                    candidate_data[f"{subj}_Marks"] = int(mark) if mark.isdigit() else mark
+                    candidate_data[f"{subj}_Grade"] = grade
+            candidate_data['Result'] = result
+            candidate_data['Comp Sub'] = comp_sub
+            candidate_data[app.SCHOOL_FIELD] = school_code
+            candidates.append(candidate_data)
+        i += 1
+
+    columns = ['Roll No', 'Gender', 'Name']
+    for code in subject_codes:
+        columns.extend([f"{code}_Marks", f"{code}_Grade"])
+    columns.extend(['Result', 'Comp Sub'])
+
+    return {'candidates': candidates, 'columns': columns, 'subject_codes': subject_codes, 'schools': schools}
+
+
+def first_difference(expected, actual):
+    for key in ['columns', 'subject_codes', 'schools']:
+        if expected[key] != actual[key]:
+            return f"{key}: expected {expected[key]!r}, got {actual[key]!r}"
+    if len(expected['candidates']) != len(actual['candidates']):
+        return f"candidates: expected {len(expected['candidates'])}, got {len(actual['candidates'])}"
+    for row, (want, got) in enumerate(zip(expected['candidates'], actual['candidates'])):
+        for key in want:
+            if want[key] != got.get(key):
+                return f"row {row} {key}: expected {want[key]!r}, got {got.get(key)!r}"
+    return None
+
+
+def check_file(path, workdir):
+    """None if the parser, and a cache round trip, match the reference; else the first difference"""
+    expected = reference_parse(path)
+    actual = app.parse_gazette(path)
+    difference = first_difference(expected, actual)
+    if difference:
+        return difference
+
+    # Round trip through the columnar cache, on a copy so nothing is left next to the input
+    copy = os.path.join(workdir, os.path.basename(path))
+    shutil.copy2(path, copy)
+    cache_path = app.parsed_cache_path(copy)
+    app.write_parsed_cache(copy, cache_path, actual)
+    loaded = app.load_parsed_cache(copy, cache_path)
+    loaded = dict(loaded, candidates=list(loaded['candidates']))
+    difference = first_difference(expected, loaded)
+    return f"cache round trip: {difference}" if difference else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the gazette parser against the reference text parser')
+    parser.add_argument('gazettes', nargs='*', help='Extra gazette files to compare')
+    args = parser.parse_args()
+
+    failures = 0
+    with tempfile.TemporaryDirectory(prefix='parser_check_') as workdir:
+        paths = []
+        for name, text in FIXTURES.items():
+            path = os.path.join(workdir, f"{name}.txt")
+            with open(path, 'w', encoding='utf-8', newline='') as f:
+                f.write(text)
+            paths.append(path)
+        paths.extend(args.gazettes)
+
+        cache_dir = os.path.join(workdir, 'cache')
+        os.makedirs(cache_dir)
+        for path in paths:
+            difference = check_file(path, cache_dir)
+            print(f"{'OK  ' if difference is None else 'FAIL'} {os.path.basename(path)}"
+                  + (f": {difference}" if difference else ''))
+            failures += difference is not None
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())